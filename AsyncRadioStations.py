@@ -0,0 +1,102 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncRadioStations:
+    """awaitable front end for RadioStations.
+    everything runs on one event loop in its own thread and
+    the blocking calls run on a bounded pool of our own (never
+    the RadioStations pool, whose workers wait on work of their
+    own) sharing the RadioStations http session, so many
+    searches and probes can be in flight without a thread per
+    request. run() is the sync adapter for callers outside the
+    loop (intent handlers)."""
+    def __init__(self, rs, max_workers=4):
+        self.rs = rs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+
+    async def _call(self, fn, *args, **kwargs):
+        return await self.loop.run_in_executor(
+                self.executor,
+                functools.partial(fn, *args, **kwargs)
+                )
+
+
+    async def search(self, sentence, limit=None):
+        """Search without touching the current station list.
+        Returns:
+            Tuple(search terms, channel index, ranked stations)
+        """
+        return await self._call(self.rs.query, sentence, limit or self.rs.search_limit)
+
+
+    async def search_many(self, sentences, limit=None):
+        """run several searches at once, results in the same order"""
+        return await asyncio.gather(*(self.search(sentence, limit) for sentence in sentences))
+
+
+    async def get_stations(self, utterance):
+        """search and make the result the current station list"""
+        await self._call(self.rs.get_stations, utterance)
+        return self.rs.get_current_station()
+
+
+    async def probe(self, url):
+        """mime type of a stream, None if it is dead"""
+        return await self._call(self.rs.probe_stream, url)
+
+
+    async def probe_many(self, urls):
+        """probe several streams at once, results in the same order"""
+        return await asyncio.gather(*(self.probe(url) for url in urls))
+
+
+    async def find_playable_station(self, step, include_current=False):
+        return await self._call(self.rs.find_playable_station, step, include_current)
+
+
+    async def next_channel(self):
+        return await self._call(self.rs.get_next_channel)
+
+
+    async def previous_channel(self):
+        return await self._call(self.rs.get_previous_channel)
+
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the shared loop from sync code.
+        Args:
+            coro: coroutine, eg self.search('jazz')
+            timeout: max seconds to wait for the result
+        Returns:
+            the coroutine's result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+    def close(self, timeout=5):
+        """stop and close the loop, then the pool"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,99 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+
+# codecs the default audio backend of a platform can decode,
+# platforms not listed are assumed to play anything
+PLATFORM_CODECS = {
+        # the simple backend, mpg123 and ogg123
+        'mycroft_mark_1': frozenset(['MP3', 'OGG']),
+        }
+
+# stream fits, higher is better
+FIT_OK = 0
+FIT_TOO_FAST = -1
+FIT_NO_DECODER = -2
+
+
+class BandwidthEstimator:
+    """moving average (exponentially weighted) of the download
+    throughput in kbps. bodies under min_bytes are mostly
+    latency and say nothing about throughput so are ignored.
+    fed by api downloads and, when those are too few (cached
+    or catalog searches), by reading the start of a stream at
+    most once every sample_interval seconds."""
+    def __init__(self, alpha=0.3, min_bytes=64*1024, sample_interval=10*60):
+        self.alpha = alpha
+        self.min_bytes = min_bytes
+        self.sample_interval = sample_interval
+        self.kbps = None
+        # monotonic time of the last download observed
+        self.observed = None
+        self.sampling = False
+        self.lock = threading.Lock()
+
+
+    def observe(self, nbytes, seconds):
+        """Add a download of nbytes that took seconds on the wire."""
+        if nbytes < self.min_bytes or seconds <= 0:
+            return
+        kbps = nbytes * 8 / 1000.0 / seconds
+        with self.lock:
+            if self.kbps is None:
+                self.kbps = kbps
+            else:
+                self.kbps += self.alpha * (kbps - self.kbps)
+            self.observed = time.monotonic()
+
+
+    def claim_sample(self):
+        """Should the caller read a stream to measure the link.
+        Returns:
+            True for one caller at a time, while there is no
+            estimate or the last download is sample_interval old
+        """
+        with self.lock:
+            if self.sampling:
+                return False
+            if self.observed is not None and time.monotonic() - self.observed < self.sample_interval:
+                return False
+            self.sampling = True
+            return True
+
+
+    def sample_done(self, nbytes, seconds):
+        """Release a claimed sample, observing what it read."""
+        with self.lock:
+            self.sampling = False
+        self.observe(nbytes, seconds)
+
+
+def stream_fit(station, codecs=None, kbps=None, headroom=0.7):
+    """How well a stream suits the device.
+    Args:
+        station: Station
+        codecs: codecs the device can decode, None for any
+        kbps: measured throughput, None if not known yet
+        headroom: share of the throughput a stream may use
+    Returns:
+        FIT_OK, FIT_TOO_FAST if the bitrate needs more than
+        the link has or FIT_NO_DECODER. streams with unknown
+        codec or bitrate are given the benefit of the doubt
+    """
+    if codecs is not None and station.codec not in ('', 'UNKNOWN') and station.codec not in codecs:
+        return FIT_NO_DECODER
+    if kbps is not None and station.bitrate > kbps * headroom:
+        return FIT_TOO_FAST
+    return FIT_OK
@@ -0,0 +1,65 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChannelStore:
+    """best stations of each channel, ranked ahead of time so
+    channel surfing and 'play music' don't wait on a search.
+    each channel keeps at most max_stations stations and at
+    most max_channels channels are kept, the least recently
+    warmed is dropped first. channels go stale after ttl
+    seconds and are searched live again."""
+    def __init__(self, max_stations=100, max_channels=32, ttl=2*60*60):
+        self.max_stations = max_stations
+        self.max_channels = max_channels
+        self.ttl = ttl
+        self.channels = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def put(self, channel, stations):
+        with self.lock:
+            self.channels.pop(channel, None)
+            self.channels[channel] = (time.monotonic(), tuple(stations[:self.max_stations]))
+            while len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+
+
+    def get(self, channel):
+        """Stored stations of a channel.
+        Returns:
+            tuple of stations, None if not stored or stale
+        """
+        with self.lock:
+            entry = self.channels.get(channel)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+
+    def age(self, channel):
+        """seconds since the channel was warmed, None if never"""
+        with self.lock:
+            entry = self.channels.get(channel)
+        if entry is None:
+            return None
+        return time.monotonic() - entry[0]
+
+
+    def clear(self):
+        with self.lock:
+            self.channels.clear()
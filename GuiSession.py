@@ -0,0 +1,90 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class GuiSession:
+    """what the GUI was last sent and the page it is showing,
+    so updates only carry changed values and don't re-show.
+    knows nothing of mycroft, gui is the skill's SkillGUI and
+    send emits one gui.value.set message holding a dict."""
+    def __init__(self, gui, send):
+        self.gui = gui
+        self.send = send
+        self.values = {}
+        self.page_shown = None
+        # SkillGUI sends all of its session data for every value
+        # set once it has shown a page, until it is released
+        self.gui_has_page = False
+        # the gui's own copy of the session data is missing
+        # values that were sent straight to the bus
+        self.bypassed_gui = False
+
+
+    def show_page(self, page, force=False):
+        """Show a page unless it is already showing, force puts
+        it back in front after something else took the screen."""
+        if self.page_shown == page and not force:
+            return
+        qml_page = f"{page}_scalable.qml"
+        self.gui.show_page(qml_page, override_idle=True)
+        self.gui_has_page = True
+        if self.bypassed_gui:
+            # show_page resent the gui's own copy of the session
+            # data, which the batched updates went around
+            self.send(dict(self.values))
+        self.page_shown = page
+
+
+    def set_values(self, values):
+        """Update the GUI session data with one message holding
+        only the values that changed since the last update."""
+        changed = {key: value for key, value in values.items() if self.values.get(key) != value}
+        if len(changed) == 0:
+            return
+        self.values.update(changed)
+        if self.page_shown is not None:
+            self.send(changed)
+            self.bypassed_gui = True
+        elif self.gui_has_page:
+            # off screen, the next show_page sends them in one
+            # go rather than the gui sending everything per value
+            self.bypassed_gui = True
+        else:
+            # nothing shown yet, show_page sends these in one go
+            for key, value in changed.items():
+                self.gui[key] = value
+
+
+    def screen_changed(self, msg_type, sender, owner):
+        """Note a bus message that may have taken our page off
+        the screen, the next update then shows it again.
+        Args:
+            msg_type: gui.page.show, gui.clear.namespace or
+                mycroft.device.show.idle
+            sender: the message's __from
+            owner: our own skill id
+        """
+        if msg_type == 'gui.page.show' and sender == owner:
+            return
+        if msg_type == 'gui.clear.namespace' and sender != owner:
+            return
+        self.page_shown = None
+
+
+    def release(self):
+        self.gui.release()
+        self.page_shown = None
+        self.values = {}
+        self.gui_has_page = False
+        self.bypassed_gui = False
@@ -0,0 +1,119 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Histogram:
+    """latency samples in seconds. percentiles come from the
+    most recent max_samples, count and sum cover everything."""
+    def __init__(self, max_samples=1000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+
+    def percentile(self, pct):
+        if len(self.samples) == 0:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+    def summary(self):
+        return {
+                'count': self.count,
+                'sum': self.total,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                }
+
+
+class Metrics:
+    """timers and counters for the search, probe and play
+    hot path. snapshot() is what goes out on the messagebus,
+    prometheus_text() what goes to the metrics file."""
+    def __init__(self, prefix='mycroft_radio'):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[name] = histogram
+            histogram.observe(seconds)
+
+
+    @contextmanager
+    def timer(self, name):
+        """time the body of a with block into the named histogram"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+
+    def incr(self, name, count=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                    'timers': {name: histogram.summary() for name, histogram in self.histograms.items()},
+                    'counters': dict(self.counters),
+                    }
+
+
+    def prometheus_text(self):
+        lines = []
+        snapshot = self.snapshot()
+        for name, summary in sorted(snapshot['timers'].items()):
+            metric = "%s_%s_seconds" % (self.prefix, name)
+            lines.append("# TYPE %s summary" % (metric,))
+            for quantile, label in (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')):
+                lines.append('%s{quantile="%s"} %f' % (metric, label, summary[quantile]))
+            lines.append("%s_sum %f" % (metric, summary['sum']))
+            lines.append("%s_count %d" % (metric, summary['count']))
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = "%s_%s_total" % (self.prefix, name)
+            lines.append("# TYPE %s counter" % (metric,))
+            lines.append("%s %d" % (metric, value))
+        return "\n".join(lines) + "\n"
+
+
+    def write_prometheus(self, path):
+        """write the prometheus text file, atomically so a scraper
+        never sees half a file"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
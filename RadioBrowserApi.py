@@ -0,0 +1,229 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import codecs
+import json
+import random
+import socket
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# used when the dns lookup of all.api.radio-browser.info fails
+FALLBACK_SERVERS = [
+        'de1.api.radio-browser.info',
+        'nl1.api.radio-browser.info',
+        'at1.api.radio-browser.info',
+        'fr1.api.radio-browser.info',
+        ]
+
+USER_AGENT = 'MycroftRadio/1.0'
+
+
+def iter_json_array(chunks):
+    """Yield the items of a json array as its bytes arrive
+    instead of waiting for and decoding the whole body.
+    Args:
+        chunks: iterable of bytes, eg response.iter_content()
+    Returns:
+        generator of decoded array items
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    started = False
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("expected a json array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                item, pos_end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # item not complete yet, wait for more bytes
+                break
+            yield item
+            pos = pos_end
+        buf = buf[pos:]
+
+    # only the closing ] returns, a body that ends before it
+    # (dropped connection, empty body) is not a complete list
+    raise ValueError("truncated json array")
+
+
+def iter_timed(chunks, network_wait):
+    """Pass chunks through, adding the seconds spent waiting
+    on the network for each to network_wait[0].
+    Args:
+        chunks: iterable of bytes, eg response.iter_content()
+        network_wait: one item list the seconds are added to
+    Returns:
+        generator of the chunks
+    """
+    chunks = iter(chunks)
+    while True:
+        start = time.monotonic()
+        chunk = next(chunks, None)
+        network_wait[0] += time.monotonic() - start
+        if chunk is None:
+            return
+        yield chunk
+
+
+def discover_servers():
+    """Find the radio-browser mirrors the way the api docs
+    recommend, by resolving all.api.radio-browser.info and
+    reverse looking up each address.
+    Returns:
+        shuffled list of mirror host names
+    """
+    servers = []
+    try:
+        for info in socket.getaddrinfo('all.api.radio-browser.info', 443, proto=socket.IPPROTO_TCP):
+            ip = info[4][0]
+            try:
+                host = socket.gethostbyaddr(ip)[0]
+            except socket.herror:
+                continue
+            if host not in servers:
+                servers.append(host)
+    except socket.gaierror:
+        pass
+
+    if len(servers) == 0:
+        servers = list(FALLBACK_SERVERS)
+    random.shuffle(servers)
+    return servers
+
+
+class RadioBrowserApi:
+    """shared http layer for everything the skill fetches.
+    one pooled keep-alive session with timeouts, api calls
+    retry with backoff and fail over across the radio-browser
+    mirrors, the last mirror that worked is tried first.
+    stream probes are never retried, a dead stream should
+    cost one timeout."""
+    def __init__(self, servers=None, scheme='https', connect_timeout=3.05,
+                 read_timeout=10, retries=2, backoff_factor=0.3, pool_size=10):
+        self.servers = servers
+        self.scheme = scheme
+        self.timeout = (connect_timeout, read_timeout)
+        self.lock = threading.Lock()
+
+        retry = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                raise_on_status=False
+                )
+        # the retrying adapter is only mounted for the api mirrors,
+        # anything else (stream urls) goes through one without retries
+        self.api_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        stream_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.mount('http://', stream_adapter)
+        self.session.mount('https://', stream_adapter)
+        self.mounted = False
+
+
+    def get_servers(self):
+        with self.lock:
+            if self.servers is None:
+                self.servers = discover_servers()
+            if not self.mounted:
+                for server in self.servers:
+                    self.session.mount("%s://%s/" % (self.scheme, server), self.api_adapter)
+                self.mounted = True
+            return list(self.servers)
+
+
+    def _promote(self, server):
+        with self.lock:
+            if self.servers and self.servers[0] != server:
+                self.servers.remove(server)
+                self.servers.insert(0, server)
+
+
+    def get(self, path, params=None, timeout=None, stream=False):
+        """GET an api path, failing over to the next mirror on error.
+        Args:
+            path: api path eg /json/stations/search
+            params: query parameters
+            timeout: (connect, read) seconds, defaults to the session timeout
+            stream: don't read the body up front
+        Returns:
+            the successful response
+        """
+        last_error = None
+        for server in self.get_servers():
+            uri = "%s://%s%s" % (self.scheme, server, path)
+            try:
+                res = self.session.get(uri, params=params, timeout=timeout or self.timeout, stream=stream)
+                res.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                last_error = e
+                continue
+            self._promote(server)
+            return res
+
+        if last_error is None:
+            last_error = requests.exceptions.ConnectionError("no radio-browser servers")
+        raise last_error
+
+
+    def get_json(self, path, params=None, timeout=None):
+        return self.get(path, params=params, timeout=timeout).json()
+
+
+    def head(self, url, timeout=None):
+        """HEAD an arbitrary url (stream probes) on the shared pool, no retries"""
+        return self.session.head(url, allow_redirects=True, timeout=timeout or self.timeout)
+
+
+    def get_stream(self, url, nbytes, timeout=None):
+        """GET the start of an arbitrary url (stream probes that
+        sample the link) on the shared pool, no retries. the body
+        is not read, the caller reads and closes the response.
+        Args:
+            url: stream url
+            nbytes: bytes wanted, live streams ignore the range
+            timeout: (connect, read) seconds
+        Returns:
+            the response
+        """
+        return self.session.get(
+                url,
+                headers={'Range': 'bytes=0-%d' % (nbytes - 1,)},
+                allow_redirects=True,
+                stream=True,
+                timeout=timeout or self.timeout
+                )
+
+
+    def close(self):
+        self.session.close()
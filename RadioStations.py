@@ -11,25 +11,126 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import logging
 import requests
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from itertools import chain
 from random import randrange
-
-def sort_on_vpc(k):
-    return k['votes_plus_clicks']
-
-def sort_on_confidence(k):
-    return k['confidence']
+from .Bandwidth import BandwidthEstimator, PLATFORM_CODECS, stream_fit
+from .ChannelStore import ChannelStore
+from .Metrics import Metrics
+from .RadioBrowserApi import RadioBrowserApi, iter_json_array, iter_timed
+from .Station import Station
+from .StationCatalog import StationCatalog
+from .StationCursor import StationCursor
+from .StationIndex import tokenize, station_tokens
+from .StationHistory import StationHistory
+from .StationRanking import StationRanking
+from .SingleFlight import SingleFlight
+from .UtteranceNormalizer import UtteranceNormalizer
+from .StreamHealth import StreamHealth, STREAM_GOOD, STREAM_DEAD, host_of
+
+LOG = logging.getLogger(__name__)
+
+# http status codes that mean a stream is gone, as opposed
+# to a server that just doesn't like HEAD requests
+DEAD_STREAM_STATUS = (404, 410)
+
+
+class SearchCache:
+    """bounded in memory cache of radio-browser search results.
+    entries expire after ttl seconds and least recently used
+    entries are evicted once there are more than max_entries or
+    they hold more than max_stations stations between them (an
+    entry can hold a thousand, about a megabyte)."""
+    def __init__(self, max_entries=32, max_stations=5000, ttl=600):
+        self.max_entries = max_entries
+        self.max_stations = max_stations
+        self.ttl = ttl
+        # shared by the search, prefetch and warm up threads
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.station_count = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def make_key(self, srch_term, limit, field='tagList'):
+        return (field, " ".join(srch_term.lower().split()), limit)
+
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return None
+
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.station_count += len(value)
+            # the newest entry stays even if it alone is too big
+            while len(self.entries) > 1 and (
+                    len(self.entries) > self.max_entries or self.station_count > self.max_stations):
+                self._remove(next(iter(self.entries)))
+
+
+    def _remove(self, key):
+        _, value = self.entries.pop(key)
+        self.station_count -= len(value)
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.station_count = 0
 
 
 class RadioStations:
-    def __init__(self):
-        self.index = 0
+    def __init__(self, catalog_path=None, catalog_refresh_interval=6*60*60, api=None,
+                 health_path=None, lang='en-us', history_path=None):
         self.blacklist = [
                 "icecast",
                 ]
-        self.media_verbs = ['play', 'listen', 'turn on', 'start']
-        self.noise_words = ['on', 'to', 'the', 'music', 'station', 'channel', 'radio']
+        self.normalizer = UtteranceNormalizer.for_lang(lang)
         self.search_limit = 1000
+        # a network mirroring one stream under many names
+        # shouldn't crowd out everything else, stations past the
+        # best few of a host rank last, None for no cap
+        self.max_stations_per_host = 3
+        self.name_search_limit = 100
+        self.tag_search_limit = 500
+        self.search_cache = SearchCache()
+        self.metrics = Metrics()
+        # concurrent identical searches and probes share one request
+        self.search_flights = SingleFlight(self.metrics, 'search_coalesced')
+        self.probe_flights = SingleFlight(self.metrics, 'probe_coalesced')
+        self.api = api or RadioBrowserApi()
+        self.health = StreamHealth(health_path)
+        self.history = StationHistory(history_path)
+        # streams needing more than the measured bandwidth or a
+        # decoder the platform lacks are ranked after the rest
+        self.bandwidth = BandwidthEstimator()
+        self.codecs = None
+        self.catalog = None
+        self.catalog_refresh_interval = catalog_refresh_interval
+        self.shutdown_event = threading.Event()
+        if catalog_path is not None:
+            self.catalog = StationCatalog(catalog_path, self.api, self.bandwidth)
+            threading.Thread(target=self._refresh_catalog, daemon=True).start()
 
         self.generic_search_terms = [
                 'jazz',
@@ -44,10 +145,38 @@ class RadioStations:
                 'bluegrass',
                 'country'
                 ]
+        # extra channels from the skill settings, warmed along
+        # with the generic ones but not part of channel surfing
+        self.extra_channels = []
+        self.channel_store = ChannelStore()
+        self.channel_warm_interval = 30*60
+        self.warm_future = None
         self.channel_index = 0
         self.last_search_terms = self.generic_search_terms[self.channel_index]
-        self.stations = self.get_stations(self.last_search_terms)
         self.original_utterance = ''
+        self.stations = []
+        self.ranking = None
+        self.cursor = StationCursor(self.stations)
+        self.rank_k = 50
+        self.stations_lock = threading.Lock()
+
+        # don't hold up skill loading on the network, the initial
+        # station list is fetched in the background and anything
+        # needing it can wait on stations_ready
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        # the extra searches _search fans out go to their own pool,
+        # _search itself runs on executor workers and waits for them
+        self.search_executor = ThreadPoolExecutor(max_workers=4)
+        # same for the stream probes of a playable station walk
+        self.probe_executor = ThreadPoolExecutor(max_workers=4)
+        self.probe_batch = 4
+        self.probe_timeout = (3.05, 5)
+        self.prefetch_depth = 2
+        self.prefetch_future = None
+        # (cursor, station index, mime) of a probed station ready
+        # to take over if the playing one dies
+        self.standby = None
+        self.stations_ready = self.executor.submit(self.get_stations, self.last_search_terms)
 
 
     def find_mime_type(self, url: str) -> str:
@@ -57,31 +186,346 @@ class RadioStations:
         Returns:
             Mime type - defaults to 'audio/mpeg'
         """
+        state, mime = self.health.lookup(url)
+        if state == STREAM_GOOD:
+            self.metrics.incr('probe_cache_hits')
+            return mime
+
+        mime, error = self._probe(url)
+        if error is not None:
+            raise error
+        return mime or 'audio/mpeg'
+
+
+    def probe_stream(self, url):
+        """Check a stream answers and get its mime type.
+        Known good and known dead streams are answered from
+        the health cache without touching the network.
+        Args:
+            url: stream url to probe
+        Returns:
+            Mime type, None if the stream is dead
+        """
+        state, mime = self.health.lookup(url)
+        if state == STREAM_GOOD:
+            self.metrics.incr('probe_cache_hits')
+            return mime
+        if state == STREAM_DEAD:
+            self.metrics.incr('probe_cache_hits')
+            return None
+
+        mime, _ = self._probe(url)
+        return mime
+
+
+    def _probe(self, url):
+        """HEAD a stream and record the outcome in stream health,
+        concurrent probes of one url share the request.
+        Returns:
+            Tuple(mime or None if dead, request exception or None)
+        """
+        return self.probe_flights.do(url, self._probe_once, url)
+
+
+    def _probe_once(self, url):
+        start = time.monotonic()
+        error = None
+        # cached and catalog searches don't download enough to
+        # measure the link, now and then a probe GETs the start
+        # of the stream instead of a HEAD to sample it
+        sample = self.bandwidth.claim_sample()
+        try:
+            if sample:
+                response = self.api.get_stream(url, self.bandwidth.min_bytes, timeout=self.probe_timeout)
+            else:
+                response = self.api.head(url, timeout=self.probe_timeout)
+        except requests.exceptions.RequestException as e:
+            response = None
+            error = e
+        self.metrics.observe('probe', time.monotonic() - start)
+        if response is None or response.status_code in DEAD_STREAM_STATUS or response.status_code >= 500:
+            if sample:
+                if response is not None:
+                    response.close()
+                self._sample_bandwidth(None)
+            self.health.record_failure(url, host_down=response is None)
+            self.metrics.incr('dead_streams')
+            return None, error
         mime = 'audio/mpeg'
-        response = requests.Session().head(url, allow_redirects=True)
         if 200 <= response.status_code < 300:
-            mime = response.headers['content-type']
-        return mime
+            mime = response.headers.get('content-type', mime)
+        self.health.record_success(url, mime, time.monotonic() - start)
+        if sample:
+            # the body is read off the probe path
+            try:
+                self.executor.submit(self._sample_bandwidth, response)
+            except RuntimeError:
+                # shutting down
+                self._sample_bandwidth(None)
+                response.close()
+        return mime, None
+
+
+    def _sample_bandwidth(self, response):
+        """Time reading the start of a probed stream and feed it
+        to the bandwidth estimate, None just releases the claim."""
+        nbytes = 0
+        seconds = 0.0
+        if response is None:
+            self.bandwidth.sample_done(nbytes, seconds)
+            return
+        try:
+            if 200 <= response.status_code < 300:
+                start = time.monotonic()
+                # a live stream keeps sending, stop once
+                # there is enough to measure
+                for _ in response.iter_content(chunk_size=16384):
+                    if response.raw.tell() >= self.bandwidth.min_bytes:
+                        break
+                nbytes = response.raw.tell()
+                seconds = time.monotonic() - start
+        except requests.exceptions.RequestException:
+            pass
+        finally:
+            response.close()
+            self.bandwidth.sample_done(nbytes, seconds)
+
+
+    def set_platform(self, platform):
+        """Rank streams the platform can't decode last.
+        Args:
+            platform: enclosure platform from the mycroft config
+        """
+        self.codecs = PLATFORM_CODECS.get(platform)
 
 
-    def clean_sentence(self, sentence):
-        sentence = sentence.lower()
-        sa = sentence.split(" ")
-        vrb = sa[0].lower()
-        if vrb in self.media_verbs:
-            sentence = sentence[len(vrb):]
+    def station_fit(self, station):
+        return stream_fit(station, self.codecs, self.bandwidth.kbps)
 
-        sa = sentence.split(" ")
-        final_sentence = ''
-        for wrd in sa:
-            if wrd not in self.noise_words:
-                final_sentence += ' ' + wrd
 
-        return final_sentence.strip()
+    @property
+    def index(self):
+        """station list index of the current station"""
+        return self.cursor.index
 
 
-    def domain_is_unique(self, stream_uri, stations):
-        return True
+    def find_playable_station(self, step, include_current=False):
+        """Probe upcoming stations in parallel batches and move
+        to the first one that answers.
+        Args:
+            step: 1 to walk forward through the stations, -1 backward
+            include_current: start with the current station instead of
+                the one after it
+        Returns:
+            Tuple(station, mime) - (None, None) if none work
+        """
+        cursor = self.cursor
+        position, mime = self._find_playable(cursor, step, include_current)
+        if position is None:
+            return None, None
+        cursor.position = position
+        return cursor.current(), mime
+
+
+    def _find_playable(self, cursor, step, include_current):
+        """first playable position walking from the cursor,
+        without moving it. Returns Tuple(position, mime)"""
+        positions = cursor.walk(step, include_current)
+        while True:
+            # known dead streams are skipped and a known good one
+            # is taken straight away, only unknowns get probed.
+            # one probe per host per batch, if the host is down
+            # the next batch skips the rest of its streams
+            futures = {}
+            batch_hosts = set()
+            for position in positions:
+                station = cursor.stations[cursor.station_index(position)]
+                state, mime = self.health.lookup(station.url_resolved)
+                if state == STREAM_GOOD:
+                    for other in futures:
+                        other.cancel()
+                    return position, mime
+                if state == STREAM_DEAD:
+                    cursor.mark_failed(position)
+                    continue
+                host = host_of(station.url_resolved)
+                if host in batch_hosts:
+                    positions = chain([position], positions)
+                    break
+                batch_hosts.add(host)
+                futures[self.probe_executor.submit(self.probe_stream, station.url_resolved)] = position
+                if len(futures) == self.probe_batch:
+                    break
+
+            if len(futures) == 0:
+                break
+
+            for future in as_completed(futures):
+                mime = future.result()
+                if mime is None:
+                    cursor.mark_failed(futures[future])
+                    continue
+                for other in futures:
+                    other.cancel()
+                return futures[future], mime
+
+        return None, None
+
+
+    def prepare_standby(self):
+        """Find and probe the station to fail over to if the
+        current one dies while playing, without moving off
+        the current one."""
+        # runs on the executor while intents may be walking the
+        # live cursor, so walk a copy. stations it finds dead are
+        # in stream health for the live walk to skip
+        cursor = self.cursor
+        snapshot = cursor.snapshot()
+        position, mime = self._find_playable(snapshot, 1, False)
+        if position is None:
+            self.standby = None
+        else:
+            self.standby = (cursor, snapshot.station_index(position), mime)
+
+
+    def failover_station(self, station):
+        """Give up on a station that failed while playing and
+        move to the standby, or the next station that answers
+        if the standby has gone stale.
+        Args:
+            station: the station that failed
+        Returns:
+            Tuple(station, mime) - (None, None) if none work
+        """
+        cursor = self.cursor
+        if station is not None:
+            # a stream failing mid play counts against its host
+            # too, repeated failures back the whole host off
+            self.health.record_failure(station.url_resolved, host_down=True)
+            current = cursor.current()
+            if current is not None and current.url_resolved == station.url_resolved:
+                cursor.mark_failed(cursor.position)
+
+        standby, self.standby = self.standby, None
+        if standby is not None:
+            standby_cursor, station_index, mime = standby
+            if standby_cursor is cursor and station_index != cursor.index:
+                standby_station = cursor.stations[station_index]
+                state, _ = self.health.lookup(standby_station.url_resolved)
+                if state != STREAM_DEAD:
+                    self.metrics.incr('standby_hits')
+                    cursor.move_to(station_index)
+                    return standby_station, mime
+        self.metrics.incr('standby_misses')
+        return self.find_playable_station(1)
+
+
+    def prefetch_adjacent(self):
+        """Warm what the next/previous station and next/previous
+        channel requests will need while something is playing,
+        the failover standby first. At most one prefetch runs at
+        a time."""
+        if self.prefetch_future is not None and not self.prefetch_future.done():
+            return
+        self.prefetch_future = self.executor.submit(self._prefetch_adjacent)
+
+
+    def _prefetch_adjacent(self):
+        self.prepare_standby()
+
+        # probe results land in the stream health cache
+        cursor = self.cursor
+        station_count = len(cursor.stations)
+        for offset in range(1, min(self.prefetch_depth, station_count // 2) + 1):
+            for step in (1, -1):
+                position = (cursor.position + step * offset) % station_count
+                station = cursor.stations[cursor.station_index(position)]
+                self.probe_stream(station.url_resolved)
+
+        # channel result sets land in the search cache, nothing
+        # to do when the local catalog is answering searches
+        if self.catalog is not None and self.catalog.is_ready():
+            return
+        channel_count = len(self.generic_search_terms)
+        for step in (1, -1):
+            srch_term = self.generic_search_terms[(self.channel_index + step) % channel_count]
+            try:
+                for _ in self._search(srch_term, self.search_limit):
+                    pass
+            except (requests.exceptions.RequestException, ValueError) as e:
+                LOG.warning("prefetch of %s failed %s" % (srch_term, e))
+
+
+    def record_play(self, station, mime):
+        """Remember a station that started playing, the history
+        file is written off the play path."""
+        self.executor.submit(self.history.record_play, station, mime)
+
+
+    def remembered_station(self, sentence=None):
+        """A favorite or recently played station, no searching.
+        Args:
+            sentence: utterance naming the station, None for
+                the last station played
+        Returns:
+            Tuple(station, mime) - (None, None) if none
+        """
+        if sentence is None:
+            return self.history.last_played()
+        name = self.clean_sentence(sentence)
+        # 'play jazz' is the jazz channel even if 'Jazz Radio' played last
+        if name in self.channel_terms():
+            return None, None
+        return self.history.find(name, self.clean_sentence)
+
+
+    def clean_sentence(self, sentence):
+        return self.normalizer.normalize(sentence)
+
+
+    def _refresh_catalog(self):
+        """background loop keeping the local catalog current"""
+        # index what is already on disk first, searches use
+        # it while the refresh below goes to the network
+        if self.catalog.is_loaded():
+            try:
+                self.catalog.build_index()
+            except Exception as e:
+                LOG.warning("catalog index failed %s" % (e,))
+        while not self.shutdown_event.is_set():
+            try:
+                self.catalog.refresh()
+            except Exception as e:
+                LOG.warning("catalog refresh failed %s" % (e,))
+            self.shutdown_event.wait(self.catalog_refresh_interval)
+
+
+    def wait_for_stations(self, timeout=None):
+        """Wait for the initial background station load.
+        Args:
+            timeout: max seconds to wait, None waits forever
+        Returns:
+            True if the initial load has finished
+        """
+        try:
+            self.stations_ready.result(timeout)
+        except FutureTimeout:
+            pass
+        except Exception as e:
+            LOG.error("initial station load failed %s" % (e,))
+        return self.stations_ready.done()
+
+
+    def shutdown(self):
+        self.shutdown_event.set()
+        self.executor.shutdown(wait=False)
+        self.search_executor.shutdown(wait=False)
+        self.probe_executor.shutdown(wait=False)
+        self.api.close()
+        try:
+            self.health.save()
+        except OSError as e:
+            LOG.warning("could not save stream health %s" % (e,))
 
 
     def blacklisted(self, stream_uri):
@@ -92,33 +536,139 @@ class RadioStations:
 
 
     def _search(self, srch_term, limit):
-        uri = "https://de1.api.radio-browser.info/json/stations/search?limit=%s&hidebroken=true&order=clickcount&reverse=true&tagList=" % (limit,)
-        query = srch_term.replace(" ", "+")
-        uri += query
-        print("\n\n%s\n\n" % (uri,))
-        res = requests.get(uri)
-        if res:
-            return res.json()
+        """Search the radio-browser api by tag list and station name,
+        and for multi word searches by partial tag too. The extra
+        searches run concurrently while the tag list results
+        stream in.
+        Args:
+            srch_term: cleaned search terms
+            limit: max number of tag list stations
+        Returns:
+            generator of Stations from all searches, duplicates included
+        """
+        searches = [('name', self.name_search_limit)]
+        if len(srch_term.split()) > 1:
+            searches.append(('tag', self.tag_search_limit))
+        futures = [
+                self.search_executor.submit(self._fetch_search_list, field, srch_term, field_limit)
+                for field, field_limit in searches
+                ]
+
+        errors = []
+        ctr = 0
+        try:
+            for station in self._fetch_search('tagList', srch_term, limit):
+                ctr += 1
+                yield station
+        except (requests.exceptions.RequestException, ValueError) as e:
+            errors.append(e)
+
+        for future in as_completed(futures):
+            try:
+                stations = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                errors.append(e)
+                continue
+            for station in stations:
+                ctr += 1
+                yield station
+
+        if ctr == 0 and len(errors) > 0:
+            raise errors[0]
 
-        return []
+
+    def _fetch_search_list(self, field, srch_term, limit):
+        return list(self._fetch_search(field, srch_term, limit))
+
+
+    def _fetch_search(self, field, srch_term, limit):
+        """One radio-browser station search.
+        Args:
+            field: api search field, tagList, tag or name
+            srch_term: cleaned search terms
+            limit: max number of stations
+        Returns:
+            iterable of Stations, a cached list or a generator
+            yielding stations as the response arrives
+        """
+        key = self.search_cache.make_key(srch_term, limit, field)
+        while True:
+            stations = self.search_cache.get(key)
+            if stations is not None:
+                self.metrics.incr('search_cache_hits')
+                return stations
+            flight, leader = self.search_flights.join(key)
+            if leader:
+                break
+            # the same search is already streaming in elsewhere,
+            # None means it was abandoned part way so try again
+            stations = flight.result()
+            if stations is not None:
+                return stations
+        self.metrics.incr('search_cache_misses')
+
+        params = {
+                'limit': limit,
+                'hidebroken': 'true',
+                'order': 'clickcount',
+                'reverse': 'true',
+                field: srch_term,
+                }
+        try:
+            with self.metrics.timer('api_search'):
+                res = self.api.get('/json/stations/search', params=params, stream=True)
+        except Exception as e:
+            self.search_flights.finish(key, flight, error=e)
+            raise
+        return self._stream_stations(res, key, flight)
+
+
+    def _stream_stations(self, res, key, flight):
+        # only the compact Stations are kept, never the whole
+        # body or the full json dicts
+        stations = []
+        # json_decode is our own time in here, less the time
+        # spent waiting on the network for the next chunk
+        # and the bytes read off the wire (compressed, not the
+        # decoded body) over that time are a throughput sample
+        network_wait = [0.0]
+        busy = 0.0
+        try:
+            resumed = time.monotonic()
+            for station in iter_json_array(iter_timed(res.iter_content(chunk_size=16384), network_wait)):
+                station = Station.from_json(station)
+                stations.append(station)
+                busy += time.monotonic() - resumed
+                yield station
+                resumed = time.monotonic()
+            busy += time.monotonic() - resumed
+            self.metrics.observe('json_decode', busy - network_wait[0])
+            self.bandwidth.observe(res.raw.tell(), network_wait[0])
+            self.search_cache.put(key, stations)
+            self.search_flights.finish(key, flight, stations)
+        except Exception as e:
+            self.search_flights.finish(key, flight, error=e)
+            raise
+        finally:
+            res.close()
+            # a consumer that stopped reading early leaves
+            # anyone waiting to search for themselves
+            self.search_flights.finish(key, flight, None)
 
 
     def confidence(self, phrase, station):
         #TODO this needs to be shared between radio 
         # and music (probably all common plays) BUT I don't know if I want it
         # to be the one in common play. we will see.
-        phrase = phrase.lower()
-        name = station['name']
-        name = name.replace("\n"," ")
-        name = name.lower()
-        tags = station.get('tags',[])
-        if type(tags) is not list:
-            tags = tags.split(",")
+        return self._confidence(phrase.lower(), station)
+
+
+    def _confidence(self, phrase, station):
+        # phrase already lower case
         confidence = 0.0
-        if phrase in name:
+        if phrase in station.name_lower:
             confidence += 0.1
-        for tag in tags:
-            tag = tag.lower()
+        for tag in station.tags:
             if phrase in tag:
                 confidence += 0.01
             if phrase == tag:
@@ -128,76 +678,200 @@ class RadioStations:
         return confidence
 
 
-    def search(self, sentence, limit):
-        unique_stations = {}
-        self.original_utterance = sentence
-        self.last_search_terms = self.clean_sentence(sentence)
-        if self.last_search_terms == '':
+    def _match_confidence(self, phrase, phrase_tokens, station):
+        """Confidence of a station, zero unless every word of the
+        phrase is a whole word of its name or tags (rock is not
+        in rockabilly). The substring checks come first, only
+        the few stations they match are split into words.
+        Args:
+            phrase: lower case utterance
+            phrase_tokens: set of its words
+            station: Station
+        """
+        confidence = self._confidence(phrase, station)
+        if confidence == 0.0 or len(phrase_tokens) == 0:
+            return 0.0
+        if not phrase_tokens <= station_tokens(station):
+            return 0.0
+        return confidence
+
+
+    def query(self, sentence, limit):
+        """Search for stations without touching the current
+        station list, index or search terms. Channels that
+        were warmed ahead of time are answered from the
+        channel store.
+        Args:
+            sentence: utterance to search for
+            limit: max number of stations to fetch
+        Returns:
+            Tuple(search terms, channel index, StationRanking)
+        """
+        query_start = time.monotonic()
+        channel_index = self.channel_index
+        with self.metrics.timer('utterance_clean'):
+            srch_terms = self.clean_sentence(sentence)
+        if srch_terms == '':
             # if search terms after clean are null it was most
             # probably something like 'play music' or 'play
             # radio' so we will just select a random genre
-            self.channel_index = randrange(len(self.generic_search_terms)-1)
-            self.last_search_terms = self.generic_search_terms[self.channel_index]
-
-        stations = self._search(self.last_search_terms, limit)
-
-        # whack dupes, favor match confidence
-        for station in stations:
-            station_name = station.get('name', '')
-            station_name = station_name.replace("\n"," ")
-            stream_uri = station.get('url_resolved','')
-            if stream_uri != '' and not self.blacklisted(stream_uri):
-                if station_name in unique_stations:
-                    if self.confidence(self.original_utterance, station) > unique_stations[station_name]['confidence']:
-                        station['confidence'] = self.confidence(self.original_utterance, station)
-                        unique_stations[station_name] = station
-                else:
-                    if self.domain_is_unique(stream_uri, stations):
-                        station['confidence'] = self.confidence(self.original_utterance, station)
-                        unique_stations[station_name] = station
-
-        res = []
-        for station in unique_stations:
-            votes_plus_clicks = 0
-            votes_plus_clicks += int( unique_stations[station].get('votes', 0) )
-            votes_plus_clicks += int( unique_stations[station].get('clickcount', 0) )
-            unique_stations[station]['votes_plus_clicks'] = votes_plus_clicks
-
-            res.append( unique_stations[station] )
-
-        #res.sort(key=sort_on_vpc, reverse=True)
-        res.sort(key=sort_on_confidence, reverse=True)
-
-        return res
-
-
-    def convert_array_to_dict(self, stations):
-        new_dict = {}
-        for station in stations:
-            uri = station.get('url_resolved','')
-            if uri != '':
-                votes_plus_clicks = int( station.get('votes', 0) ) + int( station.get('clickcount', 0) )
-                new_dict[uri] = {
-                        "name":station.get('name','').replace('\n',''),
-                        "url_resolved":uri,
-                        "home":station.get('homepage',''),
-                        "tags":station.get('tags',''),
-                        "country":station.get('country',''),
-                        "countrycode":station.get('countrycode',''),
-                        "votes":station.get('votes',''),
-                        "clickcount":station.get('clickcount',''),
-                        "votes_plus_clicks":votes_plus_clicks
-                        }
-        return new_dict
+            channel_index = randrange(len(self.generic_search_terms)-1)
+            srch_terms = self.generic_search_terms[channel_index]
+
+        stored = self.channel_store.get(srch_terms)
+        if stored is not None:
+            self.metrics.incr('channel_store_hits')
+            with self.metrics.timer('ranking'):
+                ranking = StationRanking(stored, self.health, self.rank_k, self.station_fit, self.max_stations_per_host)
+        else:
+            ranking = self._rank_stations(sentence, srch_terms, limit)
+            if srch_terms in self.channel_terms() and len(ranking) > 0:
+                self._store_channel(srch_terms, ranking)
+        self.metrics.observe('search', time.monotonic() - query_start)
+
+        return srch_terms, channel_index, ranking
+
+
+    def _rank_stations(self, sentence, srch_terms, limit):
+        """search, score, dedupe and rank"""
+        unique_stations = {}
+
+        # stations are scored and deduped as they stream in
+        phrase = sentence.lower()
+        phrase_tokens = set(tokenize(phrase))
+        scoring = 0.0
+        try:
+            stations = []
+            # the live api answers until the catalog is indexed
+            if self.catalog is not None and self.catalog.is_ready():
+                stations = self.catalog.search(srch_terms, limit)
+            if len(stations) == 0:
+                stations = self._search(srch_terms, limit)
+
+            # whack dupes, favor match confidence
+            for station in stations:
+                scoring_start = time.monotonic()
+                station_name = station.name
+                stream_uri = station.url_resolved
+                if stream_uri == '' or self.blacklisted(stream_uri):
+                    continue
+                confidence = self._match_confidence(phrase, phrase_tokens, station)
+                # copies, the search results may be cached and
+                # shared with the list that is currently playing.
+                # the per host cap is the ranking's, it has to
+                # see every station's score first
+                current = unique_stations.get(station_name)
+                if current is None or confidence > current.confidence:
+                    unique_stations[station_name] = station.with_confidence(confidence)
+                scoring += time.monotonic() - scoring_start
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.metrics.incr('search_failures')
+            LOG.warning("station search failed %s" % (e,))
+
+        with self.metrics.timer('ranking'):
+            ranking = StationRanking(
+                    unique_stations.values(), self.health, self.rank_k, self.station_fit, self.max_stations_per_host)
+        self.metrics.observe('scoring', scoring)
+        return ranking
+
+
+    def _store_channel(self, channel, ranking):
+        # copies, the ranked list grows as the cursor walks it
+        ranking.extend(self.channel_store.max_stations - len(ranking.ranked))
+        self.channel_store.put(channel, ranking.ranked[:self.channel_store.max_stations])
+
+
+    def channel_terms(self):
+        """generic channels then the user's extra ones"""
+        return self.generic_search_terms + [
+                channel for channel in self.extra_channels
+                if channel not in self.generic_search_terms
+                ]
+
+
+    def set_extra_channels(self, channels):
+        """Set the user's own channels to keep warm.
+        Args:
+            channels: list of search terms
+        """
+        self.extra_channels = [
+                " ".join(channel.lower().split()) for channel in channels
+                if channel.strip() != ''
+                ]
+
+
+    def warm_channels(self):
+        """Search and rank every channel in the background so
+        changing channel doesn't wait on the network. Channels
+        warmed within channel_warm_interval are left alone and
+        at most one warmup runs at a time."""
+        if self.warm_future is not None and not self.warm_future.done():
+            return
+        self.warm_future = self.executor.submit(self._warm_channels)
+
+
+    def _warm_channels(self):
+        for channel in self.channel_terms():
+            if self.shutdown_event.is_set():
+                return
+            age = self.channel_store.age(channel)
+            if age is not None and age < self.channel_warm_interval:
+                continue
+            with self.metrics.timer('channel_warmup'):
+                ranking = self._rank_stations(channel, channel, self.search_limit)
+            if len(ranking) > 0:
+                self._store_channel(channel, ranking)
+
+
+    def search(self, sentence, limit):
+        """Search and remember the search terms and ranking.
+        Returns:
+            the ranked stations, this list grows in place as
+            the ranking is extended
+        """
+        self.original_utterance = sentence
+        self.last_search_terms, self.channel_index, self.ranking = self.query(sentence, limit)
+        return self.ranking.ranked
+
+
+    def peek(self, sentence, timeout):
+        """Find the best station for a sentence within a time budget,
+        leaving the current station list alone. A search that runs
+        over budget keeps going in the background and warms the
+        caches for the real search.
+        Args:
+            sentence: utterance to match
+            timeout: seconds to wait for the search
+        Returns:
+            Tuple(best station or None, True if the search finished in time)
+        """
+        future = self.executor.submit(self.query, sentence, self.search_limit)
+        try:
+            _, _, ranking = future.result(timeout)
+        except FutureTimeout:
+            return None, False
+        except Exception as e:
+            LOG.warning("station peek failed %s" % (e,))
+            return None, True
+        if len(ranking.ranked) == 0:
+            return None, True
+        return ranking.ranked[0], True
 
 
     def get_stations(self, utterance):
-        self.stations = self.search(utterance, self.search_limit)
-        self.index = 0
+        # serialized so a search can't be clobbered by the
+        # initial background load finishing after it
+        with self.stations_lock:
+            shuffle = self.cursor.shuffle
+            self.stations = self.search(utterance, self.search_limit)
+            self.cursor = StationCursor(self.stations, self.ranking)
+            if shuffle:
+                self.cursor.set_shuffle(True)
 
 
     def get_station_count(self):
-        return len(self.stations)
+        """ranked stations plus those not ranked yet"""
+        return len(self.cursor)
 
 
     def get_station_index(self):
@@ -205,28 +879,23 @@ class RadioStations:
 
 
     def get_current_station(self):
-        if len(self.stations) > 0:
-            if self.index > len(self.stations):
-                # this covers up a bug
-                self.index = 0
-            return self.stations[self.index]
-        return None
+        return self.cursor.current()
 
 
     def get_next_station(self):
-        if self.index == len(self.stations):
-            self.index = 0
-        else:
-            self.index += 1
-        return self.get_current_station()
+        return self.cursor.next()
 
 
     def get_previous_station(self):
-        if self.index == 0:
-            self.index = len(self.stations) - 1
-        else:
-            self.index -= 1
-        return self.get_current_station()
+        return self.cursor.previous()
+
+
+    def set_shuffle(self, shuffle):
+        self.cursor.set_shuffle(shuffle)
+
+
+    def is_shuffled(self):
+        return self.cursor.shuffle
 
 
     def get_next_channel(self):
@@ -234,7 +903,6 @@ class RadioStations:
             self.channel_index = 0
         else:
             self.channel_index += 1
-        self.index = 0
         self.get_stations( self.generic_search_terms[self.channel_index] )
         return self.generic_search_terms[self.channel_index]
 
@@ -244,7 +912,6 @@ class RadioStations:
             self.channel_index = len(self.generic_search_terms) - 1
         else:
             self.channel_index -= 1
-        self.index = 0
         self.get_stations( self.generic_search_terms[self.channel_index] )
         return self.generic_search_terms[self.channel_index]
 
@@ -0,0 +1,75 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """coalesces concurrent work on the same key. the first
+    caller for a key (the leader) does the work, anyone asking
+    for the key while it is in flight waits for and shares the
+    leader's result instead of doing it again. nothing is kept
+    once the leader finishes, that is what the caches are for.
+    followers are counted in metrics under counter_name."""
+    def __init__(self, metrics=None, counter_name=None):
+        self.metrics = metrics
+        self.counter_name = counter_name
+        self.calls = {}
+        self.lock = threading.Lock()
+
+
+    def join(self, key):
+        """Join the flight for a key, starting it if there is none.
+        Returns:
+            Tuple(future, leader) - a leader must call finish with
+            the future, anyone else waits on future.result()
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is None:
+                future = Future()
+                self.calls[key] = future
+                return future, True
+        if self.metrics is not None:
+            self.metrics.incr(self.counter_name)
+        return future, False
+
+
+    def finish(self, key, future, result=None, error=None):
+        """End a flight, safe to call more than once."""
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+        if not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+    def do(self, key, fn, *args):
+        """Call fn(*args), or wait for the same key's call in flight.
+        Returns:
+            what fn returned, exceptions are raised in every caller
+        """
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result
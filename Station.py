@@ -0,0 +1,101 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+def to_int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class Station:
+    """the parts of a radio-browser station the skill uses.
+    built once from the api json, name and tags are
+    normalized up front so nothing downstream has to."""
+    __slots__ = (
+            'stationuuid',
+            'name',
+            'name_lower',
+            'url_resolved',
+            'homepage',
+            'tags',
+            'country',
+            'countrycode',
+            'votes',
+            'clickcount',
+            'votes_plus_clicks',
+            'codec',
+            'bitrate',
+            'confidence',
+            )
+
+    def __init__(self, stationuuid='', name='', url_resolved='', homepage='',
+                 tags=(), country='', countrycode='', votes=0, clickcount=0,
+                 codec='', bitrate=0, confidence=0.0):
+        self.stationuuid = stationuuid
+        self.name = name
+        self.name_lower = name.lower()
+        self.url_resolved = url_resolved
+        self.homepage = homepage
+        self.tags = tags
+        self.country = country
+        self.countrycode = countrycode
+        self.votes = votes
+        self.clickcount = clickcount
+        self.votes_plus_clicks = votes + clickcount
+        # upper case as radio-browser reports it (MP3, AAC+...),
+        # bitrate in kbps, '' and 0 when unknown
+        self.codec = codec
+        self.bitrate = bitrate
+        self.confidence = confidence
+
+
+    @classmethod
+    def from_json(cls, station):
+        """Build a Station from a radio-browser station dict.
+        Args:
+            station: station dict from the api or the catalog
+        Returns:
+            Station
+        """
+        tags = station.get('tags', '') or ''
+        if type(tags) is not list:
+            tags = tags.split(",")
+        return cls(
+                stationuuid=station.get('stationuuid', '') or '',
+                name=(station.get('name', '') or '').replace("\n", " "),
+                url_resolved=station.get('url_resolved', '') or '',
+                homepage=station.get('homepage', '') or '',
+                tags=tuple(tag.strip().lower() for tag in tags if tag.strip() != ''),
+                country=station.get('country', '') or '',
+                countrycode=station.get('countrycode', '') or '',
+                votes=to_int(station.get('votes', 0)),
+                clickcount=to_int(station.get('clickcount', 0)),
+                codec=(station.get('codec', '') or '').strip().upper(),
+                bitrate=to_int(station.get('bitrate', 0)),
+                )
+
+
+    def with_confidence(self, confidence):
+        """copy of this station with its own confidence"""
+        station = Station.__new__(Station)
+        for slot in Station.__slots__:
+            setattr(station, slot, getattr(self, slot))
+        station.confidence = confidence
+        return station
+
+
+    def __repr__(self):
+        return "Station(%r, %r)" % (self.name, self.url_resolved)
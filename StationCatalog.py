@@ -0,0 +1,229 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sqlite3
+import threading
+from .RadioBrowserApi import iter_json_array, iter_timed
+from .Station import Station
+from .StationIndex import StationIndex
+
+CATALOG_COLUMNS = (
+        'stationuuid',
+        'changeuuid',
+        'name',
+        'url_resolved',
+        'homepage',
+        'tags',
+        'country',
+        'countrycode',
+        'votes',
+        'clickcount',
+        'codec',
+        'bitrate',
+        'lastcheckok',
+        'lastchangetime',
+        )
+
+
+class StationCatalog:
+    """local sqlite copy of the radio-browser station list.
+    bulk loaded once from the full station dump and then
+    kept current from the api change feed so searches
+    never have to leave the device."""
+    def __init__(self, path, api, bandwidth=None):
+        self.path = path
+        self.api = api
+        # the bulk load is the biggest download the skill makes,
+        # it is a throughput sample for the BandwidthEstimator
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.index = None
+        with self._connect() as conn:
+            conn.execute(
+                    "CREATE TABLE IF NOT EXISTS stations (%s, PRIMARY KEY (stationuuid))"
+                    % (", ".join(CATALOG_COLUMNS),)
+                    )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._add_missing_columns(conn)
+            # checked on every search, keep it off the disk
+            self.loaded = self._get_meta(conn, 'loaded') == '1'
+
+
+    def _add_missing_columns(self, conn):
+        # catalogs from older versions lack newer columns, add them
+        # and forget the change feed position so the next refresh
+        # is a full load that fills them in
+        existing = set(row[1] for row in conn.execute("PRAGMA table_info(stations)"))
+        missing = [col for col in CATALOG_COLUMNS if col not in existing]
+        for col in missing:
+            conn.execute("ALTER TABLE stations ADD COLUMN %s" % (col,))
+        if missing:
+            self._set_meta(conn, 'lastchangeuuid', '')
+
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+
+    def _get_meta(self, conn, key, default=''):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+    def _value(self, station, col):
+        val = station.get(col, '')
+        if col in ('votes', 'clickcount', 'bitrate'):
+            val = int(val or 0)
+        elif col == 'lastcheckok':
+            val = int(station.get(col, 1) or 0)
+        elif col == 'name':
+            val = (val or '').replace("\n", " ")
+        return val
+
+
+    def is_loaded(self):
+        return self.loaded
+
+
+    def is_ready(self):
+        """loaded and indexed, searches can be answered locally"""
+        return self.index is not None
+
+
+    def station_count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM stations").fetchone()[0]
+
+
+    def upsert(self, stations, replace=False):
+        """Insert or update stations as returned by the radio-browser api.
+        Args:
+            stations: iterable of station dicts
+            replace: drop the existing catalog first (bulk load)
+        Returns:
+            number of stations written
+        """
+        insert_sql = "INSERT OR REPLACE INTO stations (%s) VALUES (%s)" % (
+                ", ".join(CATALOG_COLUMNS),
+                ", ".join("?" for _ in CATALOG_COLUMNS)
+                )
+        last_change = ''
+        last_change_uuid = ''
+        ctr = 0
+        with self.lock, self._connect() as conn:
+            if replace:
+                conn.execute("DELETE FROM stations")
+            for station in stations:
+                if station.get('stationuuid', '') == '':
+                    continue
+                if replace:
+                    conn.execute(insert_sql, [self._value(station, col) for col in CATALOG_COLUMNS])
+                else:
+                    # change feed entries do not carry every column
+                    # (eg votes) so only overwrite what we were given
+                    cols = [col for col in CATALOG_COLUMNS if col in station]
+                    conn.execute(
+                            "INSERT INTO stations (%s) VALUES (%s) ON CONFLICT (stationuuid) DO UPDATE SET %s" % (
+                                ", ".join(cols),
+                                ", ".join("?" for _ in cols),
+                                ", ".join("%s = excluded.%s" % (col, col) for col in cols)
+                                ),
+                            [self._value(station, col) for col in cols]
+                            )
+                change_time = station.get('lastchangetime', '')
+                if change_time >= last_change:
+                    last_change = change_time
+                    last_change_uuid = station.get('changeuuid', '')
+                ctr += 1
+
+            if last_change > self._get_meta(conn, 'lastchangetime'):
+                self._set_meta(conn, 'lastchangetime', last_change)
+                self._set_meta(conn, 'lastchangeuuid', last_change_uuid)
+            self._set_meta(conn, 'loaded', '1')
+        self.loaded = True
+        # rebuild here, off the search path
+        if ctr > 0 or self.index is None:
+            self.build_index()
+        return ctr
+
+
+    def load_from_file(self, path):
+        """bulk load from a saved station dump (json array)"""
+        with open(path, 'rb') as f:
+            return self.upsert(iter_json_array(iter(lambda: f.read(65536), b'')), replace=True)
+
+
+    def _fetch(self, path, replace=False, params=None, timeout=None):
+        # the full dump is tens of megabytes, upsert each station
+        # as it is decoded rather than holding the whole body and
+        # every dict in memory at once
+        res = self.api.get(path, params=params, timeout=timeout, stream=True)
+        network_wait = [0.0]
+        try:
+            ctr = self.upsert(
+                    iter_json_array(iter_timed(res.iter_content(chunk_size=65536), network_wait)),
+                    replace=replace
+                    )
+            if self.bandwidth is not None:
+                self.bandwidth.observe(res.raw.tell(), network_wait[0])
+            return ctr
+        finally:
+            res.close()
+
+
+    def refresh(self):
+        """bulk load the full dump the first time, after that
+        only pull the stations changed since the newest change
+        we have seen."""
+        with self._connect() as conn:
+            last_change_uuid = self._get_meta(conn, 'lastchangeuuid')
+
+        if not self.is_loaded() or last_change_uuid == '':
+            return self._fetch('/json/stations', replace=True, timeout=(5, 120))
+
+        return self._fetch(
+                '/json/stations/changed',
+                params={'lastchangeuuid': last_change_uuid},
+                timeout=(5, 60)
+                )
+
+
+    def build_index(self):
+        """(Re)build the in memory search index from the catalog,
+        called from the refresh thread, never from a search."""
+        with self.lock:
+            with self._connect() as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute("SELECT * FROM stations WHERE lastcheckok = 1").fetchall()
+            self.index = StationIndex(Station.from_json(dict(row)) for row in rows)
+
+
+    def search(self, srch_term, limit):
+        """Find stations whose tags or name contain every word of the search term.
+        Args:
+            srch_term: cleaned search terms
+            limit: max number of stations to return
+        Returns:
+            list of Stations, most clicked first, empty until
+            the index has been built
+        """
+        index = self.index
+        if index is None:
+            return []
+        return index.search(srch_term, limit)
@@ -0,0 +1,151 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import math
+import random
+
+
+class StationCursor:
+    """ring buffer style cursor over the current result set.
+    the cursor holds a position in play order, in shuffle mode
+    positions map to stations through an affine permutation
+    (a * position + b) % n so the station list is never copied.
+    stations that failed are remembered and skipped for the
+    life of the result set. walking forward past the end of
+    the ranked stations extends the ranking (not in shuffle
+    mode, which ranks everything up front)."""
+    def __init__(self, stations, ranking=None):
+        self.stations = stations
+        self.ranking = ranking
+        self.position = 0
+        self.failed = set()
+        self.shuffle = False
+        self.perm_a = 1
+        self.perm_b = 0
+
+
+    def __len__(self):
+        """every station the cursor can reach, ranked or not"""
+        if self.ranking is not None:
+            return len(self.ranking)
+        return len(self.stations)
+
+
+    def snapshot(self):
+        """Copy to walk from another thread. It shares the station
+        list but not the failed set, and never extends the ranking."""
+        cursor = StationCursor(self.stations)
+        cursor.position = self.position
+        cursor.failed = set(self.failed)
+        cursor.shuffle = self.shuffle
+        cursor.perm_a = self.perm_a
+        cursor.perm_b = self.perm_b
+        return cursor
+
+
+    def set_shuffle(self, shuffle):
+        """Turn shuffle on or off, the current station stays current."""
+        station_index = self.index
+        self.shuffle = shuffle
+        if shuffle:
+            if self.ranking is not None:
+                self.ranking.extend(self.ranking.remaining())
+            station_count = len(self.stations)
+            self.perm_a = 1
+            if station_count > 2:
+                self.perm_a = random.randrange(1, station_count)
+                while math.gcd(self.perm_a, station_count) != 1:
+                    self.perm_a = random.randrange(1, station_count)
+            self.perm_b = random.randrange(max(station_count, 1))
+        self.move_to(station_index)
+
+
+    def station_index(self, position):
+        """station list index of a play order position"""
+        if self.shuffle and len(self.stations) > 0:
+            return (self.perm_a * position + self.perm_b) % len(self.stations)
+        return position
+
+
+    @property
+    def index(self):
+        return self.station_index(self.position)
+
+
+    def move_to(self, station_index):
+        """make a station list index current"""
+        if self.shuffle and len(self.stations) > 0:
+            station_count = len(self.stations)
+            self.position = (pow(self.perm_a, -1, station_count) * (station_index - self.perm_b)) % station_count
+        else:
+            self.position = station_index
+
+
+    def current(self):
+        if 0 <= self.position < len(self.stations):
+            return self.stations[self.station_index(self.position)]
+        return None
+
+
+    def _step(self, position, step):
+        position += step
+        if position >= len(self.stations):
+            if self.shuffle or self.ranking is None or self.ranking.extend() == 0:
+                position = 0
+        elif position < 0:
+            position = len(self.stations) - 1
+        return position
+
+
+    def next(self):
+        if len(self.stations) > 0:
+            self.position = self._step(self.position, 1)
+        return self.current()
+
+
+    def previous(self):
+        if len(self.stations) > 0:
+            self.position = self._step(self.position, -1)
+        return self.current()
+
+
+    def mark_failed(self, position):
+        self.failed.add(self.station_index(position))
+
+
+    def walk(self, step, include_current=False):
+        """Play order positions from the current one in the direction
+        of step, visiting each station at most once and skipping
+        stations that already failed. Does not move the cursor.
+        Args:
+            step: 1 forward, -1 backward
+            include_current: start with the current position
+        Returns:
+            generator of positions
+        """
+        if len(self.stations) == 0:
+            return
+        # only walking forward extends the ranking
+        station_count = len(self.stations)
+        if step > 0 and not self.shuffle:
+            station_count = len(self)
+
+        position = self.position
+        if include_current and self.station_index(position) not in self.failed:
+            yield position
+        visited = 1
+        while visited < station_count + (0 if include_current else 1):
+            position = self._step(position, step)
+            visited += 1
+            if self.station_index(position) not in self.failed:
+                yield position
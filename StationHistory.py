@@ -0,0 +1,141 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import os
+import threading
+import time
+from .Station import Station
+
+LOG = logging.getLogger(__name__)
+
+
+def history_entry(station, mime):
+    return {
+            'stationuuid': station.stationuuid,
+            'name': station.name,
+            'url_resolved': station.url_resolved,
+            'homepage': station.homepage,
+            'tags': list(station.tags),
+            'codec': station.codec,
+            'bitrate': station.bitrate,
+            'mime': mime,
+            'last_good': time.time(),
+            }
+
+
+class StationHistory:
+    """favorite and recently played stations, newest first,
+    kept in a small json file so a restart can go straight
+    back to a known good stream without searching. both
+    lists are bounded and every change is written atomically."""
+    def __init__(self, path=None, max_recent=20, max_favorites=50):
+        self.path = path
+        self.max_recent = max_recent
+        self.max_favorites = max_favorites
+        self.recent = []
+        self.favorites = []
+        self.lock = threading.Lock()
+        self.load()
+
+
+    def _push(self, entries, entry, max_entries):
+        # newest first, one entry per stream
+        entries[:] = [e for e in entries if e['url_resolved'] != entry['url_resolved']]
+        entries.insert(0, entry)
+        del entries[max_entries:]
+
+
+    def record_play(self, station, mime):
+        """Remember a station that just started playing, a
+        favorite's mime and last good time are updated too."""
+        entry = history_entry(station, mime)
+        with self.lock:
+            self._push(self.recent, entry, self.max_recent)
+            for favorite in self.favorites:
+                if favorite['url_resolved'] == station.url_resolved:
+                    favorite['mime'] = mime
+                    favorite['last_good'] = entry['last_good']
+        self.save()
+
+
+    def add_favorite(self, station, mime):
+        with self.lock:
+            self._push(self.favorites, history_entry(station, mime), self.max_favorites)
+        self.save()
+
+
+    def last_played(self):
+        """Tuple(Station, mime) of the last station played, (None, None) if none"""
+        with self.lock:
+            if len(self.recent) == 0:
+                return None, None
+            entry = self.recent[0]
+        return Station.from_json(entry), entry['mime']
+
+
+    def favorite(self):
+        """Tuple(Station, mime) of the newest favorite, (None, None) if none"""
+        with self.lock:
+            if len(self.favorites) == 0:
+                return None, None
+            entry = self.favorites[0]
+        return Station.from_json(entry), entry['mime']
+
+
+    def find(self, name, normalize=None):
+        """Find a favorite, or failing that a recent station, by name.
+        Args:
+            name: station name, already normalized
+            normalize: applied to the stored names before comparing
+        Returns:
+            Tuple(Station, mime) - (None, None) if not found
+        """
+        if name == '':
+            return None, None
+        with self.lock:
+            for entry in self.favorites + self.recent:
+                entry_name = entry['name'].lower()
+                if normalize is not None:
+                    entry_name = normalize(entry_name)
+                if entry_name == name:
+                    return Station.from_json(entry), entry['mime']
+        return None, None
+
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.recent = data.get('recent', [])[:self.max_recent]
+            self.favorites = data.get('favorites', [])[:self.max_favorites]
+        except (OSError, ValueError) as e:
+            LOG.warning("could not load station history %s" % (e,))
+
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with self.lock:
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump({'recent': self.recent, 'favorites': self.favorites}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                LOG.warning("could not save station history %s" % (e,))
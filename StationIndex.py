@@ -0,0 +1,66 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def station_tokens(station):
+    """every word of a station's name and tags"""
+    tokens = set(tokenize(station.name_lower))
+    for tag in station.tags:
+        tokens.update(tokenize(tag))
+    return tokens
+
+
+class StationIndex:
+    """inverted token index over a list of stations.
+    a search only has to look at stations sharing every
+    word of the search terms."""
+    def __init__(self, stations):
+        self.stations = list(stations)
+        self.postings = {}
+        for station_id, station in enumerate(self.stations):
+            for token in station_tokens(station):
+                self.postings.setdefault(token, set()).add(station_id)
+
+
+    def __len__(self):
+        return len(self.stations)
+
+
+    def candidates(self, phrase):
+        """ids of stations containing every word of the phrase"""
+        tokens = set(tokenize(phrase))
+        if len(tokens) == 0:
+            return set()
+        postings = []
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                return set()
+            postings.append(ids)
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+
+    def search(self, phrase, limit):
+        """stations matching every word of the phrase, most clicked first"""
+        matches = [self.stations[station_id] for station_id in self.candidates(phrase)]
+        matches.sort(key=lambda station: station.clickcount, reverse=True)
+        return matches[:limit]
@@ -0,0 +1,94 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import heapq
+from collections import deque
+from .StreamHealth import STREAM_GOOD, STREAM_DEAD, host_of
+
+HEALTH_RANK = {
+        STREAM_GOOD: 1,
+        STREAM_DEAD: -1,
+        }
+
+
+class StationRanking:
+    """lazy top k ranking of search results.
+    candidates are heapified once (linear) and only the best
+    k are popped into the ranked list, the rest are popped k
+    at a time as the user walks past the end of the list.
+    stations rank on match confidence, then how well the stream
+    suits the device (fit), then stream health, then votes plus
+    clicks. only the best max_per_host stations of a host rank
+    that way, the rest of its stations come after everyone
+    else's so one network can't crowd out the others."""
+    def __init__(self, stations, health=None, k=50, fit=None, max_per_host=None):
+        self.k = k
+        self.health = health
+        self.fit = fit
+        self.max_per_host = max_per_host
+        self.host_counts = {}
+        # stations past their host's cap, in rank order
+        self.overflow = deque()
+        self.heap = []
+        for seq, station in enumerate(stations):
+            # seq keeps ties in search result order
+            self.heap.append(self.rank_key(station) + (seq, station))
+        heapq.heapify(self.heap)
+        self.ranked = []
+        self.extend()
+
+
+    def rank_key(self, station):
+        health_rank = 0
+        if self.health is not None:
+            state, _ = self.health.lookup(station.url_resolved)
+            health_rank = HEALTH_RANK.get(state, 0)
+        fit = 0
+        if self.fit is not None:
+            fit = self.fit(station)
+        # negated, heapq is a min heap
+        return (-station.confidence, -fit, -health_rank, -station.votes_plus_clicks)
+
+
+    def extend(self, k=None):
+        """Move the next best stations into the ranked list.
+        Args:
+            k: how many, defaults to the ranking's k
+        Returns:
+            number of stations added
+        """
+        added = 0
+        while added < (k or self.k):
+            if self.heap:
+                station = heapq.heappop(self.heap)[-1]
+                if self.max_per_host is not None:
+                    host = host_of(station.url_resolved)
+                    if self.host_counts.get(host, 0) >= self.max_per_host:
+                        self.overflow.append(station)
+                        continue
+                    self.host_counts[host] = self.host_counts.get(host, 0) + 1
+            elif self.overflow:
+                station = self.overflow.popleft()
+            else:
+                break
+            self.ranked.append(station)
+            added += 1
+        return added
+
+
+    def remaining(self):
+        return len(self.heap) + len(self.overflow)
+
+
+    def __len__(self):
+        return len(self.ranked) + len(self.heap) + len(self.overflow)
@@ -0,0 +1,183 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+LOG = logging.getLogger(__name__)
+
+STREAM_UNKNOWN = 'unknown'
+STREAM_GOOD = 'good'
+STREAM_DEAD = 'dead'
+
+
+@lru_cache(maxsize=4096)
+def host_of(url):
+    """lower case host[:port] of a stream url, '' if it has none"""
+    try:
+        return urlsplit(url).netloc.rpartition('@')[2].lower()
+    except ValueError:
+        return ''
+
+
+class StreamHealth:
+    """probe results per stream url (url_resolved).
+    a recent good probe is trusted for good_ttl seconds,
+    a failed stream is skipped for dead_ttl seconds doubling
+    with each consecutive failure up to max_dead_ttl.
+    hosts that stop answering are tracked as well, once a host
+    has failed host_failures times in a row every stream on it
+    is dead until the same backoff runs out or one succeeds."""
+    def __init__(self, path=None, good_ttl=15*60, dead_ttl=5*60,
+                 max_dead_ttl=24*60*60, max_entries=2000, host_failures=2):
+        self.path = path
+        self.good_ttl = good_ttl
+        self.dead_ttl = dead_ttl
+        self.max_dead_ttl = max_dead_ttl
+        self.max_entries = max_entries
+        self.host_failures = host_failures
+        self.entries = {}
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.load()
+
+
+    def _entry(self, url):
+        entry = self.entries.get(url)
+        if entry is None:
+            if len(self.entries) >= self.max_entries:
+                self._evict()
+            entry = {
+                    'mime': None,
+                    'last_success': 0,
+                    'last_failure': 0,
+                    'latency': None,
+                    'failures': 0
+                    }
+            self.entries[url] = entry
+        return entry
+
+
+    def _evict(self):
+        # drop the stalest tenth
+        def last_seen(url):
+            entry = self.entries[url]
+            return max(entry['last_success'], entry['last_failure'])
+        stale = sorted(self.entries, key=last_seen)[:max(1, self.max_entries // 10)]
+        for url in stale:
+            del self.entries[url]
+
+
+    def _backoff(self, failures):
+        return min(self.dead_ttl * 2 ** (failures - 1), self.max_dead_ttl)
+
+
+    def host_is_dead(self, host, now=None):
+        if now is None:
+            now = time.time()
+        entry = self.hosts.get(host)
+        if entry is None or entry['failures'] < self.host_failures:
+            return False
+        backoff = self._backoff(entry['failures'] - self.host_failures + 1)
+        return now - entry['last_failure'] < backoff
+
+
+    def lookup(self, url):
+        """What do we know about a stream.
+        Args:
+            url: stream url
+        Returns:
+            Tuple(state, mime) - state is one of STREAM_GOOD, STREAM_DEAD
+            or STREAM_UNKNOWN, mime is only set for good streams
+        """
+        now = time.time()
+        with self.lock:
+            if self.host_is_dead(host_of(url), now):
+                return STREAM_DEAD, None
+            entry = self.entries.get(url)
+            if entry is None:
+                return STREAM_UNKNOWN, None
+            if entry['failures'] > 0:
+                if now - entry['last_failure'] < self._backoff(entry['failures']):
+                    return STREAM_DEAD, None
+            elif now - entry['last_success'] < self.good_ttl:
+                return STREAM_GOOD, entry['mime']
+        return STREAM_UNKNOWN, None
+
+
+    def record_success(self, url, mime, latency):
+        with self.lock:
+            entry = self._entry(url)
+            entry['mime'] = mime
+            entry['last_success'] = time.time()
+            entry['latency'] = latency
+            entry['failures'] = 0
+            # any answer from a host brings all of its streams back
+            self.hosts.pop(host_of(url), None)
+
+
+    def record_failure(self, url, host_down=False):
+        """Remember a failed probe.
+        Args:
+            url: stream url
+            host_down: the host didn't answer at all (connection
+                error or timeout) rather than answering with an error
+        """
+        now = time.time()
+        with self.lock:
+            entry = self._entry(url)
+            entry['last_failure'] = now
+            entry['failures'] += 1
+            if host_down:
+                host = host_of(url)
+                host_entry = self.hosts.get(host)
+                if host_entry is None:
+                    if len(self.hosts) >= self.max_entries:
+                        oldest = min(self.hosts, key=lambda h: self.hosts[h]['last_failure'])
+                        del self.hosts[oldest]
+                    host_entry = {'last_failure': 0, 'failures': 0}
+                    self.hosts[host] = host_entry
+                host_entry['last_failure'] = now
+                host_entry['failures'] += 1
+
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if 'streams' in data:
+                self.entries = data['streams']
+                self.hosts = data.get('hosts', {})
+            else:
+                # older files only had the streams
+                self.entries = data
+        except (OSError, ValueError) as e:
+            LOG.warning("could not load stream health %s" % (e,))
+
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = json.dumps({'streams': self.entries, 'hosts': self.hosts})
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
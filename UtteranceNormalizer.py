@@ -0,0 +1,74 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+from functools import lru_cache
+
+DEFAULT_MEDIA_VERBS = ['play', 'listen', 'listen to', 'turn on', 'start']
+DEFAULT_NOISE_WORDS = ['on', 'to', 'the', 'music', 'station', 'channel', 'radio']
+
+# plain word lists, not vocab/ where every .voc is registered
+# as adapt vocabulary and 'on' or 'to' would match anything
+WORD_LIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dialog')
+
+
+def read_word_list(path):
+    """one word or phrase per line, blank lines and # comments skipped"""
+    words = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip().lower()
+            if line != '' and not line.startswith('#'):
+                words.append(line)
+    return words
+
+
+class UtteranceNormalizer:
+    """turns an utterance into search terms in one pass.
+    a leading media verb is dropped, longest match first so
+    multi word verbs like 'turn on' work, then noise words
+    are dropped. recent results are memoized."""
+    def __init__(self, media_verbs=None, noise_words=None, cache_size=256):
+        if media_verbs is None:
+            media_verbs = DEFAULT_MEDIA_VERBS
+        if noise_words is None:
+            noise_words = DEFAULT_NOISE_WORDS
+        verbs = set(tuple(verb.lower().split()) for verb in media_verbs)
+        self.media_verbs = sorted(verbs, key=len, reverse=True)
+        self.noise_words = frozenset(word.lower() for word in noise_words)
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+
+    @classmethod
+    def for_lang(cls, lang, word_list_dir=WORD_LIST_DIR):
+        """Build a normalizer from dialog/<lang>/MediaVerb.list and
+        dialog/<lang>/NoiseWord.list, using the built in english
+        words for any file a language doesn't have."""
+        lang_dir = os.path.join(word_list_dir, lang.lower())
+        word_lists = {}
+        for name in ('MediaVerb', 'NoiseWord'):
+            path = os.path.join(lang_dir, name + '.list')
+            if os.path.isfile(path):
+                word_lists[name] = read_word_list(path)
+        return cls(word_lists.get('MediaVerb'), word_lists.get('NoiseWord'))
+
+
+    def _normalize(self, sentence):
+        tokens = sentence.lower().split()
+        start = 0
+        for verb in self.media_verbs:
+            if tuple(tokens[:len(verb)]) == verb:
+                start = len(verb)
+                break
+        noise_words = self.noise_words
+        return " ".join(token for token in tokens[start:] if token not in noise_words)
@@ -13,13 +13,15 @@
 # limitations under the License.
 # TODO 
 #   play <station name> should find if provided
-#   add to favorites and play favorite
-import subprocess, requests, time
+import os, subprocess, requests, threading, time
+from collections import deque
 from typing import Tuple
 from mycroft import intent_handler, AdaptIntent
 from mycroft.audio import wait_while_speaking
 from mycroft.messagebus import Message
 from mycroft.skills.common_play_skill import CommonPlaySkill, CPSMatchLevel
+from .AsyncRadioStations import AsyncRadioStations
+from .GuiSession import GuiSession
 from .RadioStations import RadioStations
 
 # Minimum confidence levels
@@ -27,6 +29,33 @@ CONF_EXACT_MATCH = 0.9
 CONF_LIKELY_MATCH = 0.7
 CONF_GENERIC_MATCH = 0.6
 
+# Max seconds an intent waits for the initial station load
+STATION_LOAD_TIMEOUT = 10
+
+# Max seconds a Common Play query may spend finding a station. The
+# Common Play base class tells playback control we are still
+# searching, so this can cover a live search; cached, catalog and
+# channel searches answer in milliseconds
+CPS_MATCH_TIMEOUT = 1.0
+
+# Seconds between writes of the prometheus metrics file
+METRICS_WRITE_INTERVAL = 60
+
+# Seconds between background channel warmups, and before the first
+CHANNEL_WARMUP_INTERVAL = 15*60
+CHANNEL_WARMUP_DELAY = 30
+
+# Seconds between playback watchdog checks, checks without progress
+# before a stream counts as stalled and failovers in a row before
+# giving up
+WATCHDOG_INTERVAL = 5
+WATCHDOG_STALL_CHECKS = 2
+MAX_FAILOVERS = 3
+
+# Seconds after starting a stream that a queue_end is taken to be
+# the end of the stream it replaced
+QUEUE_END_GRACE = 1.0
+
 """
 MIA - RestartRadio.intent
 """
@@ -34,20 +63,85 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
     """simple streaming radio skill"""
     def __init__(self):
         super().__init__(name="RfmSkill")
-        self.rs = RadioStations()
+        self.rs = RadioStations(
+                catalog_path=os.path.join(self.file_system.path, 'stations.db'),
+                health_path=os.path.join(self.file_system.path, 'stream_health.json'),
+                lang=self.lang,
+                history_path=os.path.join(self.file_system.path, 'history.json')
+                )
+        # intent handlers go through the async front end's sync
+        # adapter, searches and probes run on its own pool
+        self.ars = AsyncRadioStations(self.rs)
         self.now_playing = None
         self.current_station = None
+        self.current_mime = None
         self.station_name = 'RFM'
         self.img_pth = ''
         self.stream_uri = ''
         self.fg_color = 'white'
         self.bg_color = 'black'
+        self.paused = False
+        self.play_started = 0
+        self.watchdog_running = False
+        self.last_position = None
+        self.position_advances = False
+        self.stalled_checks = 0
+        self.failovers = 0
+        # streams we asked the audio service to play recently, and
+        # whether the audio output is still playing one of ours
+        self.played_uris = deque(maxlen=10)
+        self.audio_owned = False
+        self.failover_lock = threading.Lock()
+        self.gui_session = GuiSession(self.gui, self._send_gui_values)
 
 
     def initialize(self):
-        time.sleep(1)
         self.platform = self.config_core["enclosure"].get("platform", "unknown")
+        self.rs.set_platform(self.platform)
         self.register_gui_handlers()
+        self.add_event('mycroft.radio.metrics', self.handle_metrics_request)
+        self.schedule_repeating_event(
+                self.write_metrics,
+                None,
+                METRICS_WRITE_INTERVAL,
+                name='WriteRadioMetrics'
+                )
+        self.settings_change_callback = self.on_settings_changed
+        self.on_settings_changed()
+        self.schedule_repeating_event(
+                self.warm_channels,
+                CHANNEL_WARMUP_DELAY,
+                CHANNEL_WARMUP_INTERVAL,
+                name='WarmRadioChannels'
+                )
+
+
+    def on_settings_changed(self):
+        channels = self.settings.get('channels') or ''
+        self.rs.set_extra_channels(channels.split(','))
+
+
+    def warm_channels(self, _=None):
+        """Rank every channel ahead of time while the radio
+        is idle so channel changes don't wait on a search."""
+        if self.now_playing:
+            return
+        self.rs.warm_channels()
+
+
+    def handle_metrics_request(self, message):
+        """Answer a metrics query on the messagebus with the
+        latency percentiles and counters."""
+        self.bus.emit(message.response(self.rs.metrics.snapshot()))
+
+
+    def write_metrics(self, _=None):
+        """Write the metrics as a prometheus text file."""
+        path = os.path.join(self.file_system.path, 'metrics.prom')
+        try:
+            self.rs.metrics.write_prometheus(path)
+        except OSError as e:
+            self.log.warning("Could not write metrics %s" % (e,))
 
 
     def register_gui_handlers(self):
@@ -55,9 +149,14 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
         self.bus.on('mycroft.audio.service.pause', self.handle_audioservice_status_change)
         self.bus.on('mycroft.audio.service.resume', self.handle_audioservice_status_change)
         self.bus.on('mycroft.audio.queue_end', self.handle_media_finished)
+        self.bus.on('mycroft.audio.service.play', self.handle_audioservice_play)
+        self.bus.on('gui.page.show', self.handle_gui_screen_change)
+        self.bus.on('gui.clear.namespace', self.handle_gui_screen_change)
+        self.bus.on('mycroft.device.show.idle', self.handle_gui_screen_change)
         self.gui.register_handler('cps.gui.pause', self.handle_gui_status_change)
         self.gui.register_handler('cps.gui.play', self.handle_gui_status_change)
         self.gui.register_handler('cps.gui.restart', self.handle_gui_restart)
+        self.gui.register_handler('cps.gui.shuffle', self.handle_gui_shuffle)
 
 
     def handle_audioservice_status_change(self, message):
@@ -72,20 +171,124 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
             new_status = "Playing"
         elif command == "pause":
             new_status = "Paused"
-        self.gui['status'] = new_status
+        self.paused = command == "pause"
+        self.last_position = None
+        self.gui_session.set_values({'status': new_status})
+
+
+    def handle_audioservice_play(self, message):
+        """Track whether the audio output is playing our stream,
+        once another skill has started its own audio its queue_end
+        and silence are none of the watchdog's business."""
+        uris = []
+        for track in message.data.get('tracks', []):
+            if isinstance(track, (list, tuple)):
+                track = track[0]
+            uris.append(track)
+        self.audio_owned = any(uri in self.played_uris for uri in uris)
 
 
     def handle_media_finished(self, _):
-        """Handle media playback finishing."""
-        self.log.warning("RadioMediaFinished! should never get here!")
-        if self.now_playing:
-            self.gui.release()
-            self.now_playing = False
+        """Handle media playback finishing, a radio stream only
+        finishes when the station dies."""
+        if not self.now_playing or not self.audio_owned:
+            return
+        if time.monotonic() - self.play_started < QUEUE_END_GRACE:
+            return
+        self.failover("ended")
+
+
+    def start_watchdog(self):
+        self.last_position = None
+        self.position_advances = False
+        self.stalled_checks = 0
+        if not self.watchdog_running:
+            self.watchdog_running = True
+            self.schedule_repeating_event(
+                    self.check_playback,
+                    None,
+                    WATCHDOG_INTERVAL,
+                    name='RadioWatchdog'
+                    )
+
+
+    def stop_watchdog(self):
+        if self.watchdog_running:
+            self.watchdog_running = False
+            self.cancel_scheduled_event('RadioWatchdog')
+
+
+    def check_playback(self, _=None):
+        """Playback watchdog, fail over when the stream stops
+        moving. Uses the track position once it has been seen to
+        advance, backends that can't report one answer 0 forever,
+        until then whether anything is playing."""
+        if not self.now_playing or self.paused or not self.audio_owned:
+            return
+        position = None
+        try:
+            position = self.audioservice.get_track_position()
+        except AttributeError:
+            # older audio service without track positions
+            pass
+        if position is not None and self.last_position is not None and position != self.last_position:
+            self.position_advances = True
+        if self.position_advances:
+            stalled = position == self.last_position
+        else:
+            stalled = not self.audioservice.is_playing
+        self.last_position = position
+
+        if not stalled:
+            self.stalled_checks = 0
+            self.failovers = 0
+            return
+        self.stalled_checks += 1
+        if self.stalled_checks >= WATCHDOG_STALL_CHECKS:
+            self.failover("stalled")
 
 
-    def _show_gui_page(self, page):
-        qml_page = f"{page}_scalable.qml"
-        self.gui.show_page(qml_page, override_idle=True)
+    def failover(self, reason):
+        """Switch from a station that died while playing to the
+        standby station, giving up after MAX_FAILOVERS in a row."""
+        if not self.failover_lock.acquire(blocking=False):
+            # already failing over
+            return
+        try:
+            self.log.warning("Station %s %s, failing over" % (self.station_name, reason))
+            self.rs.metrics.incr('failovers')
+            if self.failovers >= MAX_FAILOVERS:
+                self.log.error("%s failovers in a row, giving up" % (self.failovers,))
+                self.speak("Sorry, the radio stations stopped working")
+                self.stop()
+                return
+            self.failovers += 1
+            with self.rs.metrics.timer('failover'):
+                station, mime = self.rs.failover_station(self.current_station)
+            if station is None:
+                self.rs.metrics.incr('no_working_station')
+                self.log.error("of %s stations, none work!" % (self.rs.get_station_count(),))
+                self.stop()
+                return
+            self.play_station(station, mime)
+        finally:
+            self.failover_lock.release()
+
+
+    def _send_gui_values(self, values):
+        data = dict(values)
+        data['__from'] = self.skill_id
+        self.bus.emit(Message('gui.value.set', data))
+
+
+    def handle_gui_screen_change(self, message):
+        """Another skill's page or the idle screen took over the
+        display, show the player again on the next update."""
+        self.gui_session.screen_changed(
+                message.msg_type,
+                message.data.get('__from'),
+                self.skill_id
+                )
 
 
     def handle_gui_status_change(self, message):
@@ -110,16 +313,22 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
         self.restart_playback(None)
 
 
-    def update_radio_theme(self, status):
-        self.gui['theme'] = dict(fgColor=self.fg_color, bgColor=self.bg_color)
+    def handle_gui_shuffle(self, _):
+        """Toggle shuffling the stations of the current channel."""
+        self.rs.set_shuffle(not self.rs.is_shuffled())
+        self.log.info("Station shuffle %s" % ('on' if self.rs.is_shuffled() else 'off',))
+
 
+    def update_radio_theme(self, status):
         self.img_pth = "/opt/mycroft/skills/skill-rfm.mycroftai/ui/images/radio.jpg"
         if self.fg_color == 'white':
             self.img_pth = "/opt/mycroft/skills/skill-rfm.mycroftai/ui/images/radio4.jpg"
 
-        channel_info = "%s/%s" % (self.rs.index+1, len(self.rs.stations))
-        station_name = self.current_station.get('name','').replace("\n","")
-        self.gui['media'] = {
+        channel_info = "%s/%s" % (self.rs.get_station_index()+1, self.rs.get_station_count())
+        station_name = self.current_station.name
+        self.gui_session.set_values({
+            'theme': dict(fgColor=self.fg_color, bgColor=self.bg_color),
+            'media': {
                 "image": self.img_pth,
                 "artist": " NOW STREAMING: " + station_name,
                 "track": 'Track',
@@ -127,32 +336,43 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
                 "skill": self.skill_id,
                 "current_station_info": channel_info,
                 "streaming": True
-        }
-        self.gui['status'] = status
-        self._show_gui_page('AudioPlayer')
+            },
+            'status': status,
+        })
+        self.gui_session.show_page('AudioPlayer')
 
 
     def setup_for_play(self, utterance):
-        self.rs.get_stations(utterance)
-        self.current_station = self.rs.get_current_station()
+        self.current_station = self.ars.run(self.ars.get_stations(utterance))
 
 
-    def handle_play_request(self):
+    def handle_play_request(self, mime=None):
         """play the current station if there is one"""
         if self.current_station is None:
             self.log.error("Can't find any matching stations for = %s" % (self.rs.last_search_terms,))
             self.speak("Can not find any %s stations" % (self.rs.last_search_terms,))
             return
 
-        stream_uri = self.current_station.get('url_resolved', '')
-        station_name = self.current_station.get('name','').replace('\n','')
+        stream_uri = self.current_station.url_resolved
+        station_name = self.current_station.name
 
-        mime = self.rs.find_mime_type(stream_uri)
+        if mime is None:
+            mime = self.rs.find_mime_type(stream_uri)
 
-        self.CPS_play((stream_uri, mime))
+        self.played_uris.append(stream_uri)
+        self.audio_owned = True
+        with self.rs.metrics.timer('play'):
+            self.CPS_play((stream_uri, mime))
+        self.rs.metrics.incr('stations_played')
 
         self.now_playing = 'Now Playing'
+        self.paused = False
+        self.play_started = time.monotonic()
+        self.start_watchdog()
+        self.current_mime = mime
+        self.rs.record_play(self.current_station, mime)
         self.update_radio_theme('Playing')
+        self.rs.prefetch_adjacent()
 
         # cast to str for json serialization
         self.CPS_send_status(
@@ -170,6 +390,7 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
             self.speak("Play artist works Oh Kay for some artists but radio stations are not really artist specific.")
             self.speak("Next station and next channel or previous station and previous channel will select a different channel or station.")
             self.speak("You can also say change radio to change the radio Theme.")
+            self.speak("Say add this station to favorites, and later play my favorite station.")
             self.speak("For the graphical you eye.")
 
 
@@ -186,15 +407,14 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
                 self.bg_color = 'black'
 
             if self.now_playing:
-                self.gui.release()
-                self.update_radio_theme('Playing')
+                self.update_radio_theme('Paused' if self.paused else 'Playing')
 
 
     @intent_handler("ShowRadio.intent")
     def handle_show_radio(self, _):
         with self.activity():
             if self.now_playing is not None:
-                self._show_gui_page("AudioPlayer")
+                self.gui_session.show_page("AudioPlayer", force=True)
             else:
                 self.speak_dialog("no.radio.playing")
 
@@ -202,102 +422,135 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
     @intent_handler("NextStation.intent")
     def handle_next_station(self, message):
         with self.activity():
-            exit_flag = False
-            ctr = 0
-            while not exit_flag and ctr < self.rs.get_station_count():
-                new_current_station = self.rs.get_next_station()
-                self.current_station = new_current_station
-                self.stream_uri = self.current_station.get('url_resolved','')
-                self.station_name = self.current_station.get('name', '')
-                self.station_name = self.station_name.replace("\n"," ")
-
-                try:
-                    self.handle_play_request()
-                    exit_flag = True
-                except:
-                    self.log.error("Caught Exception")
-
-                ctr += 1
+            self.rs.wait_for_stations(STATION_LOAD_TIMEOUT)
+            self.play_first_working(1)
 
 
     @intent_handler("PreviousStation.intent")
     def handle_previous_station(self, message):
         with self.activity():
-            exit_flag = False
-            ctr = 0
-            while not exit_flag and ctr < self.rs.get_station_count():
-                new_current_station = self.rs.get_previous_station()
-                self.current_station = new_current_station
-                self.stream_uri = self.current_station.get('url_resolved','')
-                self.station_name = self.current_station.get('name', '')
-                self.station_name = self.station_name.replace("\n"," ")
-
-                try:
-                    self.handle_play_request()
-                    exit_flag = True
-                except:
-                    self.log.error("Caught Exception")
-
-                ctr += 1
+            self.rs.wait_for_stations(STATION_LOAD_TIMEOUT)
+            self.play_first_working(-1)
 
 
     @intent_handler("NextChannel.intent")
     def handle_next_channel(self, message):
         with self.activity():
-            self.rs.get_next_channel()
+            self.ars.run(self.ars.next_channel())
             self.handle_next_station(message)
 
 
     @intent_handler("PreviousChannel.intent")
     def handle_previous_channel(self, message):
         with self.activity():
-            self.rs.get_previous_channel()
+            self.ars.run(self.ars.previous_channel())
             self.handle_previous_station(message)
 
 
+    @intent_handler("AddFavorite.intent")
+    def handle_add_favorite(self, _):
+        with self.activity():
+            if self.current_station is None:
+                self.speak("Play a station first, then I can add it to your favorites")
+                return
+            self.rs.history.add_favorite(self.current_station, self.current_mime)
+            self.speak("Added %s to your favorites" % (self.station_name,))
+
+
+    @intent_handler("PlayFavorite.intent")
+    def handle_play_favorite(self, _):
+        with self.activity():
+            station, _ = self.rs.history.favorite()
+            if station is None:
+                self.speak("You don't have any favorite stations yet")
+                return
+            if not self.play_known_station(station):
+                self.speak("%s is not answering right now" % (station.name,))
+
+
     @intent_handler("ListenToRadio.intent")
     def handle_padacious_intent(self, message):
         with self.activity():
             if message.data:
-                self.setup_for_play( message.data.get('utterance', '') )
+                utterance = message.data.get('utterance', '')
+                if self.play_remembered(utterance):
+                    return
+                self.setup_for_play(utterance)
                 self.handle_play_request()
 
 
+    def play_first_working(self, step, include_current=False):
+        """play the first station that answers a probe, walking
+        the station list in the direction of step"""
+        with self.rs.metrics.timer('find_playable'):
+            station, mime = self.ars.run(self.ars.find_playable_station(step, include_current))
+        if station is None:
+            self.rs.metrics.incr('no_working_station')
+            self.log.error("of %s stations, none work!" % (self.rs.get_station_count(),))
+            self.speak("Can not find any %s stations" % (self.rs.last_search_terms,))
+            return False
+
+        self.failovers = 0
+        self.play_station(station, mime)
+        return True
+
+
+    def play_station(self, station, mime):
+        self.current_station = station
+        self.stream_uri = self.current_station.url_resolved
+        self.station_name = self.current_station.name
+        self.handle_play_request(mime)
+
+
     def play_current(self):
-        exit_flag = False
-        ctr = 0
-        while not exit_flag and ctr < self.rs.get_station_count():
-            new_current_station = self.rs.get_next_station()
-            self.current_station = new_current_station
-            self.stream_uri = self.current_station.get('url_resolved','')
-            self.station_name = self.current_station.get('name', '')
-            self.station_name = self.station_name.replace("\n"," ")
-
-            try:
-                self.handle_play_request()
-                exit_flag = True
-            except:
-                self.log.error("Caught Exception")
+        return self.play_first_working(1, include_current=True)
 
-            ctr += 1
 
-        if not exit_flag:
-            self.log.error("of %s stations, none work!" % (self.rs.get_station_count(),))
+    def play_remembered(self, utterance=None):
+        """Play a favorite or recently played station without
+        searching for it.
+        Args:
+            utterance: what was asked for, None for the last
+                station played
+        Returns:
+            True if a remembered station is playing
+        """
+        station, _ = self.rs.remembered_station(utterance)
+        return station is not None and self.play_known_station(station)
+
+
+    def play_known_station(self, station):
+        """play a station from the history, one probe at most
+        and none if it played fine recently"""
+        mime = self.rs.probe_stream(station.url_resolved)
+        if mime is None:
+            self.log.info("Remembered station %s is not answering" % (station.name,))
+            return False
+        self.failovers = 0
+        self.play_station(station, mime)
+        return True
 
 
     @intent_handler("PlayRadio.intent")
     def handle_play_intent(self, message):
         with self.activity():
             if message.data:
-                self.setup_for_play( message.data.get('utterance', '') )
+                utterance = message.data.get('utterance', '')
+                if self.play_remembered(utterance):
+                    return
+                self.setup_for_play(utterance)
                 self.play_current()
 
 
 
     @intent_handler("TurnOnRadio.intent")
     def handle_turnon_intent(self, message):
+        # straight back to the last station after a restart
+        if self.current_station is None and self.play_remembered():
+            return
+        self.rs.wait_for_stations(STATION_LOAD_TIMEOUT)
         if self.current_station is None:
-            self.setup_for_play( self.rs.get_next_channel() )
+            self.setup_for_play( self.ars.run(self.ars.next_channel()) )
         self.play_current()
 
 
@@ -322,17 +575,35 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
         """
         # Translate match confidence levels to CPSMatchLevels
         self.log.debug("CPS Match Request")
-        self.setup_for_play( phrase )
+
+        # a favorite or recent station asked for by name needs
+        # no search. otherwise read only, the station list is only
+        # replaced in CPS_start if we actually win. a search that
+        # can't finish within budget still warms the caches for
+        # CPS_start
+        station, _ = self.rs.remembered_station(phrase)
+        remembered = station is not None
+        in_time = True
+        if not remembered:
+            station, in_time = self.rs.peek(phrase, CPS_MATCH_TIMEOUT)
 
         match_level = 0.0
         tags = []
         confidence = 0.0
         stream_uri = ''
-        if self.current_station:
+        station_name = 'RFM'
+        if station:
             match_level = CPSMatchLevel.EXACT
-            tags = self.current_station.get('tags',[])
-            confidence = self.current_station.get('confidence',0.0)
-            stream_uri = self.current_station.get('url_resolved','')
+            tags = list(station.tags)
+            confidence = CONF_EXACT_MATCH if remembered else station.confidence
+            stream_uri = station.url_resolved
+            station_name = station.name
+        elif not in_time:
+            # deliberate trade off, a search still running after the
+            # budget is bet on as a generic match (it keeps going and
+            # warms the caches for CPS_start) rather than turning
+            # down a phrase we may well have stations for
+            match_level = CPSMatchLevel.GENERIC
 
 
         # skill specific alternations
@@ -351,17 +622,22 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
         if ' by ' in phrase.lower():
             confidence = 0.01
 
-        skill_data = {'name':self.station_name, 
+        skill_data = {'name':station_name, 
                 'media_uri':stream_uri, 
                 'confidence':confidence,
-                'tags':tags}
+                'tags':tags,
+                'utterance':phrase}
 
-        return self.station_name, match_level, skill_data
+        return station_name, match_level, skill_data
 
 
-    def CPS_start(self, _, data):
+    def CPS_start(self, phrase, data):
         """Handle request from Common Play System to start playback."""
-        self.handle_play_request()
+        utterance = data.get('utterance', phrase)
+        if self.play_remembered(utterance):
+            return
+        self.setup_for_play(utterance)
+        self.play_current()
 
 
     def stop(self) -> bool:
@@ -369,12 +645,18 @@ class RadioFreeMycroftSkill(CommonPlaySkill):
         if self.now_playing is None:
             return False
         self.now_playing = None
+        self.stop_watchdog()
         self.CPS_send_status()
-        self.gui.release()
+        self.gui_session.release()
         self.CPS_release_output_focus()
         return True
 
 
+    def shutdown(self):
+        self.ars.close()
+        self.rs.shutdown()
+
+
 def create_skill():
     return RadioFreeMycroftSkill()
 
@@ -0,0 +1,532 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Offline benchmarks for the radio skill.
+
+Replays a radio-browser station dump from a local stub server and
+times the search, channel, probe and play paths. Results are written
+as json so time to first audio can be tracked across versions.
+
+    python benchmarks/run_benchmarks.py --latency 0.05 --dead 0.3 -o bench.json
+
+Pass --fixture with a saved https://de1.api.radio-browser.info/json/stations
+dump to replay real data, otherwise a synthetic dump is generated.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_server import make_fixture, start_stub_server
+
+SKILL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKILL_PACKAGE = 'radio_skill'
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def load_skill_module(name):
+    """Import one of the skill's modules without running the
+    skill's __init__ (which needs mycroft-core)."""
+    if SKILL_PACKAGE not in sys.modules:
+        package = types.ModuleType(SKILL_PACKAGE)
+        package.__path__ = [SKILL_DIR]
+        sys.modules[SKILL_PACKAGE] = package
+    return importlib.import_module("%s.%s" % (SKILL_PACKAGE, name))
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+            'rounds': len(samples),
+            'mean': statistics.mean(samples),
+            'min': ordered[0],
+            'p50': ordered[len(ordered) // 2],
+            'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            'max': ordered[-1],
+            }
+
+
+def timed(rounds, fn, setup=None):
+    samples = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def make_radio_stations(server, catalog_path=None):
+    RadioStations = load_skill_module('RadioStations').RadioStations
+    RadioBrowserApi = load_skill_module('RadioBrowserApi').RadioBrowserApi
+    host, port = server.server_address[:2]
+    api = RadioBrowserApi(servers=['%s:%s' % (host, port)], scheme='http')
+    rs = RadioStations(catalog_path=catalog_path, api=api)
+    # the stub serves every stream from the one host
+    rs.max_stations_per_host = None
+    rs.wait_for_stations()
+    return rs
+
+
+def cold(rs):
+    def setup():
+        rs.search_cache.clear()
+        rs.health.entries.clear()
+        rs.health.hosts.clear()
+        rs.channel_store.clear()
+    return setup
+
+
+@benchmark
+def search_cold(rs, rounds):
+    return timed(rounds, lambda: rs.search('play soft rock', rs.search_limit), cold(rs))
+
+
+@benchmark
+def search_warm(rs, rounds):
+    rs.search('play soft rock', rs.search_limit)
+    return timed(rounds, lambda: rs.search('play soft rock', rs.search_limit))
+
+
+@benchmark
+def search_concurrent_cold(rs, rounds, server=None):
+    """the CPS query and the play intent searching the same
+    utterance at once, should cost one set of api requests"""
+    utterances = ['play soft rock', 'soft rock', 'listen to soft rock', 'play soft rock']
+    requests_before = server.state.requests
+    with ThreadPoolExecutor(len(utterances)) as pool:
+        def run():
+            for future in [pool.submit(rs.query, utterance, rs.search_limit) for utterance in utterances]:
+                future.result()
+        result = timed(rounds, run, cold(rs))
+    result['api_requests_per_round'] = (server.state.requests - requests_before) / rounds
+    return result
+
+
+@benchmark
+def next_channel_cold(rs, rounds):
+    return timed(rounds, rs.get_next_channel, cold(rs))
+
+
+@benchmark
+def next_channel_warmed(rs, rounds):
+    """channel change once every channel has been warmed"""
+    rs.warm_channels()
+    rs.warm_future.result()
+    return timed(rounds, rs.get_next_channel)
+
+
+@benchmark
+def find_mime_type_cold(rs, rounds):
+    rs.get_stations('jazz')
+    station = rs.get_current_station()
+    return timed(rounds, lambda: rs.probe_stream(station.url_resolved), cold(rs))
+
+
+@benchmark
+def time_to_first_audio_cold(rs, rounds):
+    """search plus the first working station walk, the network
+    part of the skill's play_current"""
+    def play():
+        rs.get_stations('play jazz')
+        rs.find_playable_station(1, include_current=True)
+    return timed(rounds, play, cold(rs))
+
+
+@benchmark
+def stream_fit(rs, rounds):
+    """bitrate of the top ranked stations against the
+    throughput measured from the search responses"""
+    def search():
+        rs.bandwidth.kbps = None
+        rs.search_cache.clear()
+        rs.channel_store.clear()
+        # first search measures the link, the second ranks with it
+        rs.search('play rock', rs.search_limit)
+        rs.search_cache.clear()
+        rs.search('play rock', rs.search_limit)
+    result = timed(rounds, search)
+    top = rs.ranking.ranked[:10]
+    result['estimated_kbps'] = rs.bandwidth.kbps
+    result['top10_mean_bitrate'] = statistics.mean(station.bitrate for station in top) if top else 0
+    return result
+
+
+def synthetic_stations(count):
+    """count Stations with a spread of match confidences"""
+    Station = load_skill_module('Station').Station
+    rnd = random.Random(count)
+    stations = [Station.from_json(station) for station in make_fixture(count, seed=count)]
+    for station in stations:
+        station.confidence = rnd.choice((0.0, 0.01, 0.1, 0.11, 0.2))
+    return stations
+
+
+@benchmark
+def ranking_topk(rs, rounds):
+    """lazy top k ranking against a full sort on the same keys,
+    over 10k and 100k synthetic stations (catalog sized)"""
+    StationRanking = load_skill_module('StationRanking').StationRanking
+    # only used for its rank_key, so both sort on the same thing
+    keys = StationRanking([], rs.health, rs.rank_k, rs.station_fit)
+    result = {}
+    for count in (10000, 100000):
+        stations = synthetic_stations(count)
+        result[str(count)] = {
+                'top_k': timed(rounds, lambda: StationRanking(stations, rs.health, rs.rank_k, rs.station_fit)),
+                'full_sort': timed(rounds, lambda: sorted(stations, key=keys.rank_key)),
+                }
+    return result
+
+
+@benchmark
+def clean_sentence(rs, rounds):
+    """per utterance normalization cost, cold then memoized"""
+    phrases = [
+            'play some soft rock music',
+            'turn on the jazz radio',
+            'listen to the classical station',
+            'play pink floyd',
+            'start the bluegrass channel',
+            ]
+    # all distinct so cold rounds miss the memo, few enough to fit in it
+    utterances = ["%s %d" % (phrases[i % len(phrases)], i) for i in range(200)]
+    def run():
+        for utterance in utterances:
+            rs.clean_sentence(utterance)
+    result = timed(rounds, run, rs.normalizer.normalize.cache_clear)
+    for key in ('mean', 'min', 'p50', 'p95', 'max'):
+        result[key] /= len(utterances)
+    result['warm_per_utterance'] = timed(rounds, run)['mean'] / len(utterances)
+    return result
+
+
+@benchmark
+def catalog_search(rs, rounds, stations=None):
+    StationCatalog = load_skill_module('StationCatalog').StationCatalog
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = StationCatalog(os.path.join(tmp, 'stations.db'), rs.api)
+        load_start = time.perf_counter()
+        catalog.upsert(stations, replace=True)
+        load_time = time.perf_counter() - load_start
+        result = timed(rounds, lambda: catalog.search('soft rock', rs.search_limit))
+    result['bulk_load'] = load_time
+    return result
+
+
+def old_confidence(phrase, station):
+    """RadioStations.confidence before the token index,
+    scoring a raw api dict, kept to compare against"""
+    phrase = phrase.lower()
+    name = station['name']
+    name = name.replace("\n"," ")
+    name = name.lower()
+    tags = station.get('tags',[])
+    if type(tags) is not list:
+        tags = tags.split(",")
+    confidence = 0.0
+    if phrase in name:
+        confidence += 0.1
+    for tag in tags:
+        tag = tag.lower()
+        if phrase in tag:
+            confidence += 0.01
+        if phrase == tag:
+            confidence += 0.1
+
+    confidence = min(confidence,1.0)
+    return confidence
+
+
+@benchmark
+def scorer(rs, rounds, stations=None):
+    """scoring a few phrases against the whole dump, the old
+    scan of every dict against the whole word check
+    _rank_stations does on Stations"""
+    Station = load_skill_module('Station').Station
+    tokenize = load_skill_module('StationIndex').tokenize
+    phrases = ['soft rock', 'jazz', 'classic rock radio', 'bluegrass', 'smooth jazz']
+    compact = [Station.from_json(station) for station in stations]
+
+    def old():
+        for phrase in phrases:
+            for station in stations:
+                old_confidence(phrase, station)
+
+    def new():
+        for phrase in phrases:
+            phrase = phrase.lower()
+            phrase_tokens = set(tokenize(phrase))
+            for station in compact:
+                rs._match_confidence(phrase, phrase_tokens, station)
+
+    return {
+            'old': timed(rounds, old),
+            'new': timed(rounds, new),
+            'stations': len(stations),
+            'phrases': len(phrases),
+            }
+
+
+def retained_bytes(build):
+    """memory still allocated after build() returns, what a cache
+    of its result holds on to"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return retained
+
+
+@benchmark
+def station_memory(rs, rounds, stations=None):
+    """memory held by one cached result set as the raw api json
+    dicts, as Stations with a __dict__ and as __slots__ Stations,
+    after a search has scored it (the old search added keys to
+    the dicts in place, anything the new one leaves on a Station
+    is counted too). allocation is deterministic, rounds is ignored"""
+    Station = load_skill_module('Station').Station
+
+    class DictStation:
+        # the same fields without __slots__
+        __init__ = Station.__init__
+        with_confidence = Station.with_confidence
+
+    def searched_dicts():
+        result_set = json.loads(body)
+        for station in result_set:
+            station['confidence'] = old_confidence('play rock', station)
+            station['votes_plus_clicks'] = int(station.get('votes', 0)) + int(station.get('clickcount', 0))
+        return result_set
+
+    def searched(result_set):
+        # the ranking is thrown away, only the cached set is measured
+        with mock.patch.object(rs, '_search', return_value=result_set), \
+                mock.patch.object(rs, 'catalog', None):
+            rs._rank_stations('play rock', 'rock', rs.search_limit)
+        return result_set
+
+    body = json.dumps(stations[:rs.search_limit])
+    count = len(json.loads(body))
+    # once up front, so the metrics and caches the search sets
+    # up on first use aren't counted against the first result set
+    searched([Station.from_json(station) for station in json.loads(body)])
+    result = {
+            'json_dicts': retained_bytes(searched_dicts),
+            'dict_station': retained_bytes(lambda: searched(
+                [Station.from_json.__func__(DictStation, station) for station in json.loads(body)])),
+            'slots_station': retained_bytes(lambda: searched(
+                [Station.from_json(station) for station in json.loads(body)])),
+            }
+    for key in list(result):
+        result[key + '_per_station'] = result[key] / count
+    result['stations'] = count
+    return result
+
+
+def peak_bytes(run):
+    """peak memory allocated while run() executes"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    run()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return peak
+
+
+@benchmark
+def stream_parse(rs, rounds, server=None):
+    """decoding the full /json/stations dump into Stations all at
+    once (res.json()) against iter_json_array as chunks arrive:
+    peak memory, and time until the first station is usable"""
+    Station = load_skill_module('Station').Station
+    iter_json_array = load_skill_module('RadioBrowserApi').iter_json_array
+    body = rs.api.get('/json/stations').content
+    chunk_size = 16384
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    def whole():
+        return [Station.from_json(station) for station in json.loads(body)]
+
+    def streamed():
+        return [Station.from_json(station) for station in iter_json_array(chunks)]
+
+    def first_whole():
+        res = rs.api.get('/json/stations')
+        Station.from_json(res.json()[0])
+
+    def first_streamed():
+        res = rs.api.get('/json/stations', stream=True)
+        try:
+            Station.from_json(next(iter_json_array(res.iter_content(chunk_size=chunk_size))))
+        finally:
+            res.close()
+
+    return {
+            'body_bytes': len(body),
+            'whole_peak_bytes': peak_bytes(whole),
+            'streamed_peak_bytes': peak_bytes(streamed),
+            'whole_first_station': timed(rounds, first_whole),
+            'streamed_first_station': timed(rounds, first_streamed),
+            }
+
+
+def load_skill(rs):
+    """the skill bound to a mocked messagebus, None without mycroft-core"""
+    try:
+        import mycroft  # noqa: F401
+    except ImportError:
+        return None
+
+    spec = importlib.util.spec_from_file_location(
+            'radio_skill_full',
+            os.path.join(SKILL_DIR, '__init__.py'),
+            submodule_search_locations=[SKILL_DIR]
+            )
+    skill_module = importlib.util.module_from_spec(spec)
+    sys.modules['radio_skill_full'] = skill_module
+    spec.loader.exec_module(skill_module)
+    with mock.patch.object(skill_module, 'RadioStations', return_value=rs):
+        skill = skill_module.create_skill()
+    skill.bind(mock.MagicMock())
+    skill.platform = 'benchmark'
+    return skill
+
+
+@benchmark
+def skill_play_current(rs, rounds):
+    """the skill's own play_current with a mocked messagebus,
+    only when mycroft-core is importable"""
+    skill = load_skill(rs)
+    if skill is None:
+        return {'skipped': 'mycroft-core not installed'}
+    bus = skill.bus
+
+    def play():
+        rs.get_stations('play jazz')
+        skill.play_current()
+    result = timed(rounds, play, cold(rs))
+    result['bus_messages'] = bus.emit.call_count
+    return result
+
+
+@benchmark
+def skill_station_surf(rs, rounds):
+    """bus messages per next station once something is playing,
+    only when mycroft-core is importable"""
+    skill = load_skill(rs)
+    if skill is None:
+        return {'skipped': 'mycroft-core not installed'}
+    bus = skill.bus
+    rs.get_stations('play jazz')
+    skill.play_current()
+
+    bus.emit.reset_mock()
+    result = timed(rounds, lambda: skill.play_first_working(1))
+    msg_types = [call[0][0].msg_type for call in bus.emit.call_args_list]
+    result['bus_messages_per_surf'] = len(msg_types) / rounds
+    result['gui_value_sets_per_surf'] = msg_types.count('gui.value.set') / rounds
+    result['gui_page_shows_per_surf'] = msg_types.count('gui.page.show') / rounds
+    return result
+
+
+def git_version():
+    try:
+        return subprocess.check_output(
+                ['git', 'describe', '--always', '--dirty'],
+                cwd=SKILL_DIR, stderr=subprocess.DEVNULL
+                ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--fixture', help='saved radio-browser /json/stations dump')
+    parser.add_argument('--stations', type=int, default=5000, help='size of the generated dump')
+    parser.add_argument('--latency', type=float, default=0.02, help='stub response delay in seconds')
+    parser.add_argument('--dead', type=float, default=0.2, help='fraction of dead stream urls')
+    parser.add_argument('--bandwidth', type=int, default=0, help='stub throughput in kbps, 0 unthrottled')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help='run just these')
+    parser.add_argument('-o', '--output', help='write json here instead of stdout')
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture) as f:
+            stations = json.load(f)
+    else:
+        stations = make_fixture(args.stations)
+
+    server = start_stub_server(stations, args.latency, args.dead, args.bandwidth)
+    rs = make_radio_stations(server)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        if name in ('catalog_search', 'station_memory', 'scorer'):
+            results[name] = BENCHMARKS[name](rs, args.rounds, stations)
+        elif name in ('search_concurrent_cold', 'stream_parse'):
+            results[name] = BENCHMARKS[name](rs, args.rounds, server)
+        else:
+            results[name] = BENCHMARKS[name](rs, args.rounds)
+
+    report = {
+            'version': git_version(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'config': {
+                'fixture': args.fixture or 'generated',
+                'stations': len(stations),
+                'latency': args.latency,
+                'dead_fraction': args.dead,
+                'bandwidth': args.bandwidth,
+                'rounds': args.rounds,
+                },
+            'results': results,
+            'metrics': rs.metrics.snapshot(),
+            'stub_requests': server.state.requests,
+            }
+    rs.shutdown()
+    server.shutdown()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
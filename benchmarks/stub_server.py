@@ -0,0 +1,193 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local stand in for the radio-browser api and the streams it lists.
+
+Serves station searches from a fixture (a recorded /json/stations dump
+or a generated one), with stream urls rewritten to point back at this
+server. A configurable fraction of streams are dead (404), every
+response can be delayed and bodies can be throttled to simulate a
+slow link.
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+GENRES = [
+        'jazz', 'rock', 'classical', 'easy listening', 'ska', 'fusion',
+        'punk', 'rockabily', 'metal', 'bluegrass', 'country', 'pop',
+        'news', 'talk', 'soft rock', 'classic rock', 'blues', 'reggae',
+        'smooth jazz', 'hip hop', 'electronic', 'ambient', 'folk', 'soul',
+        ]
+CODECS = [('MP3', 128), ('MP3', 320), ('AAC', 64), ('AAC+', 48), ('OGG', 96)]
+
+
+def make_fixture(count=5000, seed=1):
+    """Generate a station dump shaped like /json/stations."""
+    rnd = random.Random(seed)
+    stations = []
+    for i in range(count):
+        tags = rnd.sample(GENRES, rnd.randint(1, 4))
+        codec, bitrate = rnd.choice(CODECS)
+        # a tenth of the stations share a name, like mirrored streams
+        name = "%s Radio %d" % (tags[0].title(), i % (count - count // 10) if count > 10 else i)
+        stations.append({
+                'stationuuid': 'uuid-%d' % (i,),
+                'changeuuid': 'change-%d' % (i,),
+                'name': name,
+                'url': 'http://stream%d.example/live' % (i % 200,),
+                'url_resolved': 'http://stream%d.example/live' % (i % 200,),
+                'homepage': 'http://station%d.example/' % (i,),
+                'favicon': '',
+                'tags': ",".join(tags),
+                'country': 'Nowhere',
+                'countrycode': 'NW',
+                'language': 'english',
+                'votes': rnd.randint(0, 5000),
+                'clickcount': rnd.randint(0, 20000),
+                'clicktrend': 0,
+                'codec': codec,
+                'bitrate': bitrate,
+                'lastcheckok': 1,
+                'lastchangetime': '2021-01-01 00:00:00',
+                })
+    return stations
+
+
+class StubState:
+    def __init__(self, stations, latency=0.0, dead_fraction=0.0, bandwidth=0):
+        self.stations = stations
+        self.latency = latency
+        self.dead_fraction = dead_fraction
+        # kbps, 0 for unthrottled
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+    def is_dead(self, stream_id):
+        return zlib.crc32(stream_id.encode()) % 1000 < self.dead_fraction * 1000
+
+
+def matches(station, params):
+    tags = [tag.strip().lower() for tag in station.get('tags', '').split(',')]
+    if 'tagList' in params:
+        for wanted in params['tagList'][0].lower().split(','):
+            if wanted.strip() not in tags:
+                return False
+    if 'tag' in params:
+        wanted = params['tag'][0].lower()
+        if not any(wanted in tag for tag in tags):
+            return False
+    if 'name' in params:
+        if params['name'][0].lower() not in station.get('name', '').lower():
+            return False
+    return True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client closed a response before reading all of
+            # it (streamed parsing, stream samples)
+            pass
+
+
+    def _send(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        bandwidth = self.server.state.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk_size = 8192
+        for start in range(0, len(body), chunk_size):
+            chunk = body[start:start + chunk_size]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) * 8 / 1000.0 / bandwidth)
+
+
+    def _stream_url(self, station):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%s/stream/%s" % (host, port, station['stationuuid'])
+
+
+    def _handle(self):
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        if state.latency:
+            time.sleep(state.latency)
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path.startswith('/stream/'):
+            if state.is_dead(url.path[len('/stream/'):]):
+                self._send(404, b'gone', 'text/plain')
+            else:
+                self._send(200, b'\xff\xfb' * 512, 'audio/mpeg')
+            return
+
+        if url.path == '/json/stations/changed':
+            self._send(200, b'[]')
+            return
+
+        if url.path == '/json/stations':
+            stations = state.stations
+        elif url.path == '/json/stations/search':
+            stations = [station for station in state.stations if matches(station, params)]
+            stations.sort(key=lambda station: station['clickcount'], reverse=True)
+            limit = int(params.get('limit', ['100000'])[0])
+            stations = stations[:limit]
+        else:
+            self._send(404, b'[]')
+            return
+
+        stations = [dict(station, url_resolved=self._stream_url(station)) for station in stations]
+        self._send(200, json.dumps(stations).encode())
+
+
+    def do_GET(self):
+        self._handle()
+
+
+    def do_HEAD(self):
+        self._handle()
+
+
+def start_stub_server(stations, latency=0.0, dead_fraction=0.0, bandwidth=0):
+    """Start the stub on a free localhost port in a daemon thread.
+    Returns:
+        the server, server.server_address has the port
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(stations, latency, dead_fraction, bandwidth)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,46 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The skill's modules are imported as the radio_skill package
+without running the skill's __init__ (which needs mycroft-core)."""
+import os
+import sys
+import types
+
+import pytest
+
+SKILL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKILL_PACKAGE = 'radio_skill'
+
+if SKILL_PACKAGE not in sys.modules:
+    package = types.ModuleType(SKILL_PACKAGE)
+    package.__path__ = [SKILL_DIR]
+    sys.modules[SKILL_PACKAGE] = package
+
+
+class SkillDirCollector:
+    """collects the skill's own directory as a plain directory.
+    pytest imports a package's __init__.py while setting it up,
+    running pytest from the skill directory would import the
+    skill and need mycroft-core."""
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collect_directory(self, path, parent):
+        if str(path) == SKILL_DIR:
+            return pytest.Dir.from_parent(parent, path=path)
+        return None
+
+
+def pytest_configure(config):
+    # registered as a plugin, hooks of this conftest only
+    # apply below test/
+    config.pluginmanager.register(SkillDirCollector(), 'radio-skill-dir')
@@ -0,0 +1,182 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from radio_skill.GuiSession import GuiSession
+
+SKILL_ID = 'skill-rfm.mycroftai'
+OTHER_SKILL_ID = 'skill-weather.mycroftai'
+
+
+class FakeBus:
+    """records emitted (msg_type, data) and keeps what the GUI
+    would be displaying for our namespace"""
+    def __init__(self):
+        self.messages = []
+        self.displayed = {}
+
+    def emit(self, msg_type, data):
+        self.messages.append((msg_type, data))
+        if msg_type == 'gui.value.set':
+            self.displayed.update({key: value for key, value in data.items() if key != '__from'})
+        elif msg_type == 'gui.clear.namespace':
+            self.displayed = {}
+
+    def types(self):
+        return [msg_type for msg_type, _ in self.messages]
+
+    def clear(self):
+        self.messages = []
+
+
+class FakeSkillGUI:
+    """the bus traffic of mycroft's SkillGUI. show_page syncs
+    all the session data before showing the page, and once a
+    page has been shown every value set sends all of it again.
+    release clears the namespace."""
+    def __init__(self, bus):
+        self.bus = bus
+        self.session_data = {}
+        self.page = None
+
+    def __setitem__(self, key, value):
+        self.session_data[key] = value
+        if self.page:
+            self.bus.emit('gui.value.set', dict(self.session_data, __from=SKILL_ID))
+
+    def show_page(self, name, override_idle=None):
+        self.bus.emit('gui.value.set', dict(self.session_data, __from=SKILL_ID))
+        self.bus.emit('gui.page.show', {'page': [name], '__from': SKILL_ID, '__idle': override_idle})
+        self.page = name
+
+    def release(self):
+        self.session_data = {}
+        self.page = None
+        self.bus.emit('gui.clear.namespace', {'__from': SKILL_ID})
+        self.bus.emit('mycroft.gui.screen.close', {'skill_id': SKILL_ID})
+
+
+def make_session():
+    """a session wired up the way the skill does it"""
+    bus = FakeBus()
+    gui = FakeSkillGUI(bus)
+    session = GuiSession(gui, lambda values: bus.emit('gui.value.set', dict(values, __from=SKILL_ID)))
+    return session, bus
+
+
+def media(station):
+    return {'artist': " NOW STREAMING: " + station}
+
+
+def play(session, station, status='Playing'):
+    session.set_values({'media': media(station), 'status': status})
+    session.show_page('AudioPlayer')
+
+
+def test_first_play_syncs_everything_then_shows_the_page():
+    session, bus = make_session()
+    play(session, 'one')
+    assert bus.messages == [
+            ('gui.value.set', {'media': media('one'), 'status': 'Playing', '__from': SKILL_ID}),
+            ('gui.page.show', {'page': ['AudioPlayer_scalable.qml'], '__from': SKILL_ID, '__idle': True}),
+            ]
+
+
+def test_surf_sends_only_the_changed_values():
+    session, bus = make_session()
+    play(session, 'one')
+    bus.clear()
+    for station in ('two', 'three', 'four'):
+        play(session, station)
+    assert bus.messages == [
+            ('gui.value.set', {'media': media(station), '__from': SKILL_ID})
+            for station in ('two', 'three', 'four')
+            ]
+    assert bus.displayed == {'media': media('four'), 'status': 'Playing'}
+
+
+def test_status_change_sends_only_the_status():
+    session, bus = make_session()
+    play(session, 'one')
+    bus.clear()
+    session.set_values({'status': 'Paused'})
+    assert bus.messages == [('gui.value.set', {'status': 'Paused', '__from': SKILL_ID})]
+
+
+def test_unchanged_values_send_nothing():
+    session, bus = make_session()
+    play(session, 'one')
+    bus.clear()
+    play(session, 'one')
+    assert bus.messages == []
+
+
+def test_page_shown_again_after_another_skill_takes_the_screen():
+    session, bus = make_session()
+    play(session, 'one')
+    play(session, 'two')
+    session.screen_changed('gui.page.show', OTHER_SKILL_ID, SKILL_ID)
+    bus.clear()
+    play(session, 'three', status='Paused')
+    # the gui syncs its own (stale) copy, ours follows in one message
+    assert bus.types() == ['gui.value.set', 'gui.page.show', 'gui.value.set']
+    assert bus.messages[-1] == (
+            'gui.value.set', {'media': media('three'), 'status': 'Paused', '__from': SKILL_ID})
+    assert bus.displayed == {'media': media('three'), 'status': 'Paused'}
+
+
+def test_updates_while_off_screen_are_not_sent_per_value():
+    session, bus = make_session()
+    play(session, 'one')
+    session.screen_changed('mycroft.device.show.idle', None, SKILL_ID)
+    bus.clear()
+    session.set_values({'media': media('two'), 'status': 'Paused'})
+    assert bus.messages == []
+    session.show_page('AudioPlayer')
+    assert bus.types() == ['gui.value.set', 'gui.page.show', 'gui.value.set']
+    assert bus.displayed == {'media': media('two'), 'status': 'Paused'}
+
+
+def test_own_page_show_and_other_namespaces_are_ignored():
+    session, bus = make_session()
+    play(session, 'one')
+    session.screen_changed('gui.page.show', SKILL_ID, SKILL_ID)
+    session.screen_changed('gui.clear.namespace', OTHER_SKILL_ID, SKILL_ID)
+    bus.clear()
+    play(session, 'two')
+    assert bus.messages == [('gui.value.set', {'media': media('two'), '__from': SKILL_ID})]
+
+
+def test_own_namespace_cleared():
+    session, bus = make_session()
+    play(session, 'one')
+    play(session, 'two')
+    bus.emit('gui.clear.namespace', {'__from': SKILL_ID})
+    session.screen_changed('gui.clear.namespace', SKILL_ID, SKILL_ID)
+    bus.clear()
+    play(session, 'three')
+    assert bus.types() == ['gui.value.set', 'gui.page.show', 'gui.value.set']
+    assert bus.displayed == {'media': media('three'), 'status': 'Playing'}
+
+
+def test_release_starts_over():
+    session, bus = make_session()
+    play(session, 'one')
+    play(session, 'two')
+    session.release()
+    assert bus.types()[-2:] == ['gui.clear.namespace', 'mycroft.gui.screen.close']
+    bus.clear()
+    play(session, 'one')
+    assert bus.messages == [
+            ('gui.value.set', {'media': media('one'), 'status': 'Playing', '__from': SKILL_ID}),
+            ('gui.page.show', {'page': ['AudioPlayer_scalable.qml'], '__from': SKILL_ID, '__idle': True}),
+            ]
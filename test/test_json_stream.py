@@ -0,0 +1,91 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import io
+import json
+
+import pytest
+
+from radio_skill.RadioBrowserApi import iter_json_array
+from radio_skill.StationCatalog import StationCatalog
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def make_dump(count):
+    return [
+            {
+                'stationuuid': 'uuid-%d' % (i,),
+                'changeuuid': 'change-%d' % (i,),
+                'name': 'Station é %d' % (i,),
+                'url_resolved': 'http://host%d/stream' % (i,),
+                'tags': 'jazz,rock',
+                'lastchangetime': '2021-01-01 00:00:%02d' % (i % 60,),
+                }
+            for i in range(count)
+            ]
+
+
+@pytest.mark.parametrize('size', (1, 3, 7, 64, 100000))
+def test_items_across_any_chunking(size):
+    dump = make_dump(20)
+    body = json.dumps(dump).encode()
+    assert list(iter_json_array(chunked(body, size))) == dump
+
+
+def test_empty_array():
+    assert list(iter_json_array([b' [ ] '])) == []
+
+
+@pytest.mark.parametrize('body', (b'', b'[', b'[{"a":1},', b'[{"a":1},{"a":'))
+def test_truncated_body_raises(body):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(body, 4) or [body]))
+
+
+def test_not_an_array_raises():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"a": 1}']))
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.raw = io.BytesIO(body)
+
+    def iter_content(self, chunk_size=1):
+        return iter(chunked(self.body, chunk_size))
+
+    def close(self):
+        pass
+
+
+class FakeApi:
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, path, params=None, timeout=None, stream=False):
+        return FakeResponse(self.body)
+
+
+def test_truncated_bulk_load_keeps_the_catalog(tmp_path):
+    catalog = StationCatalog(str(tmp_path / 'stations.db'), FakeApi(b''))
+    catalog.upsert(make_dump(100), replace=True)
+    body = json.dumps(make_dump(200)).encode()
+    catalog.api = FakeApi(body[:len(body) // 2])
+    with pytest.raises(ValueError):
+        catalog._fetch('/json/stations', replace=True)
+    assert catalog.station_count() == 100
+    assert len(catalog.search('jazz', 1000)) == 100
@@ -0,0 +1,50 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from radio_skill.RadioStations import SearchCache
+
+
+def test_bounded_by_entries():
+    cache = SearchCache(max_entries=2, max_stations=1000)
+    for key in 'abc':
+        cache.put(key, [key])
+    assert list(cache.entries) == ['b', 'c']
+    assert cache.station_count == 2
+
+
+def test_bounded_by_stations_held():
+    cache = SearchCache(max_entries=32, max_stations=1000)
+    cache.put('a', [0] * 400)
+    cache.put('b', [0] * 400)
+    assert cache.get('a') is not None
+    # 'b' is now the least recently used
+    cache.put('c', [0] * 400)
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.station_count == 800
+
+
+def test_newest_entry_kept_even_if_too_big():
+    cache = SearchCache(max_stations=10)
+    cache.put('a', [0] * 5)
+    cache.put('b', [0] * 50)
+    assert list(cache.entries) == ['b']
+    assert cache.station_count == 50
+
+
+def test_replacing_and_expiring_keep_the_count():
+    cache = SearchCache(ttl=-1)
+    cache.put('a', [0] * 5)
+    cache.put('a', [0] * 3)
+    assert cache.station_count == 3
+    assert cache.get('a') is None
+    assert cache.station_count == 0
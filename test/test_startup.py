@@ -0,0 +1,56 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import sys
+import time
+
+import pytest
+
+from radio_skill.RadioBrowserApi import RadioBrowserApi
+from radio_skill.RadioStations import RadioStations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from stub_server import make_fixture, start_stub_server
+
+STALL = 5
+
+
+@pytest.fixture
+def stalled_server():
+    """a radio-browser stub that takes STALL seconds to answer"""
+    server = start_stub_server(make_fixture(100), latency=STALL)
+    yield server
+    server.shutdown()
+
+
+def make_api(server):
+    # give up soon after the test so the worker threads
+    # aren't left retrying at interpreter exit
+    host, port = server.server_address[:2]
+    return RadioBrowserApi(servers=['%s:%s' % (host, port)], scheme='http', read_timeout=STALL / 2, retries=0)
+
+
+@pytest.mark.parametrize('with_catalog', (False, True))
+def test_constructor_does_not_wait_for_the_network(stalled_server, tmp_path, with_catalog):
+    catalog_path = str(tmp_path / 'stations.db') if with_catalog else None
+    start = time.monotonic()
+    rs = RadioStations(catalog_path=catalog_path, api=make_api(stalled_server))
+    elapsed = time.monotonic() - start
+    try:
+        assert elapsed < 1
+        # the initial load is still waiting on the server
+        assert not rs.wait_for_stations(timeout=0)
+        assert rs.get_station_count() == 0
+    finally:
+        rs.shutdown()
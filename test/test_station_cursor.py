@@ -0,0 +1,199 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Property style tests of the station cursor, each test runs
+over many random station counts, failures and shuffles (seeded,
+so a failure names the seed that reproduces it)."""
+import random
+
+import pytest
+
+from radio_skill.Station import Station
+from radio_skill.StationCursor import StationCursor
+from radio_skill.StationRanking import StationRanking
+
+SEEDS = range(200)
+
+
+def make_stations(rng, count):
+    return [
+            Station(name="station %s" % (i,), url_resolved="http://host%s/stream" % (i,),
+                    votes=rng.randrange(1000), clickcount=rng.randrange(1000))
+            for i in range(count)
+            ]
+
+
+def make_cursor(rng, count=None, ranked=False):
+    count = rng.randrange(0, 40) if count is None else count
+    stations = make_stations(rng, count)
+    if ranked:
+        ranking = StationRanking(stations, k=rng.randrange(1, 10))
+        cursor = StationCursor(ranking.ranked, ranking)
+    else:
+        cursor = StationCursor(stations)
+    if rng.random() < 0.5:
+        cursor.set_shuffle(True)
+    if len(cursor.stations) > 0:
+        cursor.position = rng.randrange(len(cursor.stations))
+    for _ in range(rng.randrange(0, count + 1)):
+        cursor.mark_failed(rng.randrange(len(cursor.stations)))
+    return cursor
+
+
+def station_indexes(cursor, positions):
+    return [cursor.station_index(position) for position in positions]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_next_wraps_around_to_the_start(seed):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng, count=rng.randrange(1, 40))
+    start = cursor.current()
+    seen = [start]
+    for _ in range(len(cursor.stations) - 1):
+        seen.append(cursor.next())
+    assert cursor.next() is start
+    # every station once per lap, shuffled or not
+    assert sorted(id(station) for station in seen) == sorted(id(station) for station in cursor.stations)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_previous_undoes_next(seed):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng, count=rng.randrange(1, 40))
+    steps = rng.randrange(0, 100)
+    start = cursor.position
+    for _ in range(steps):
+        cursor.next()
+    for _ in range(steps):
+        cursor.previous()
+    assert cursor.position == start
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_previous_from_the_first_wraps_to_the_last(seed):
+    rng = random.Random(seed)
+    cursor = StationCursor(make_stations(rng, rng.randrange(1, 40)))
+    cursor.previous()
+    assert cursor.position == len(cursor.stations) - 1
+    assert cursor.current() is cursor.stations[-1]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('step', (1, -1))
+def test_walk_visits_every_working_station_once(seed, step):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng)
+    start = cursor.position
+    include_current = rng.random() < 0.5
+    visited = station_indexes(cursor, cursor.walk(step, include_current))
+
+    working = set(range(len(cursor.stations))) - cursor.failed
+    assert len(visited) == len(set(visited))
+    assert set(visited) == working
+    # walking doesn't move the cursor
+    assert cursor.position == start
+    current = cursor.station_index(start)
+    if current in working:
+        # the current station comes first or last, never between
+        assert visited[0 if include_current else -1] == current
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_walk_follows_play_order(seed):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng, count=rng.randrange(1, 40))
+    cursor.failed.clear()
+    for step in (1, -1):
+        # what pressing next (or previous) would play
+        stepping = cursor.snapshot()
+        expected = [stepping.index]
+        for _ in range(len(cursor.stations) - 1):
+            if step > 0:
+                stepping.next()
+            else:
+                stepping.previous()
+            expected.append(stepping.index)
+        assert station_indexes(cursor, cursor.walk(step, include_current=True)) == expected
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_walk_forward_extends_the_ranking(seed):
+    rng = random.Random(seed)
+    count = rng.randrange(1, 60)
+    stations = make_stations(rng, count)
+    ranking = StationRanking(stations, k=rng.randrange(1, 10))
+    cursor = StationCursor(ranking.ranked, ranking)
+    visited = list(cursor.walk(1))
+    assert len(visited) == count
+    assert ranking.remaining() == 0
+    assert sorted(station_indexes(cursor, visited)) == list(range(count))
+    # best first, the walk ends back at the current station
+    assert [cursor.stations[i] for i in station_indexes(cursor, visited)][:-1] == ranking.ranked[1:]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_shuffle_is_a_permutation(seed):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng, count=rng.randrange(1, 60))
+    cursor.set_shuffle(True)
+    count = len(cursor.stations)
+    assert sorted(station_indexes(cursor, range(count))) == list(range(count))
+    for station_index in range(count):
+        cursor.move_to(station_index)
+        assert cursor.index == station_index
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_shuffle_keeps_the_current_station(seed):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng, count=rng.randrange(1, 60), ranked=rng.random() < 0.5)
+    for _ in range(rng.randrange(0, 20)):
+        cursor.next()
+    for shuffle in (True, False, True):
+        current = cursor.current()
+        cursor.set_shuffle(shuffle)
+        assert cursor.current() is current
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_shuffle_ranks_everything(seed):
+    rng = random.Random(seed)
+    count = rng.randrange(1, 60)
+    ranking = StationRanking(make_stations(rng, count), k=rng.randrange(1, 10))
+    cursor = StationCursor(ranking.ranked, ranking)
+    cursor.set_shuffle(True)
+    assert len(cursor.stations) == count
+    assert ranking.remaining() == 0
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_snapshot_walks_like_the_cursor_without_sharing_failures(seed):
+    rng = random.Random(seed)
+    cursor = make_cursor(rng)
+    snapshot = cursor.snapshot()
+    assert list(snapshot.walk(1)) == list(cursor.walk(1))
+    failed = set(cursor.failed)
+    for position in snapshot.walk(1):
+        snapshot.mark_failed(position)
+    assert cursor.failed == failed
+
+
+def test_empty_cursor():
+    cursor = StationCursor([])
+    assert cursor.current() is None
+    assert cursor.next() is None
+    assert cursor.previous() is None
+    assert list(cursor.walk(1, include_current=True)) == []
+    cursor.set_shuffle(True)
+    assert cursor.current() is None
@@ -0,0 +1,57 @@
+# Copyright 2021 Mycroft AI Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import random
+
+import pytest
+
+from radio_skill.Station import Station
+from radio_skill.StationRanking import StationRanking
+
+
+def station(name, host, confidence=0.0, votes=0):
+    return Station(name=name, url_resolved="http://%s/%s" % (host, name.replace(' ', '_')),
+                   votes=votes, confidence=confidence)
+
+
+def walk_all(ranking):
+    while ranking.extend():
+        pass
+    return [station.name for station in ranking.ranked]
+
+
+def test_cap_keeps_the_best_of_a_host_not_the_first():
+    # the name match arrives after the host's tag matches
+    stations = [station("Jazz %d" % (i,), 'stream.zeno.fm', votes=1000 - i) for i in range(5)]
+    stations.append(station("Pink Floyd Radio", 'stream.zeno.fm', confidence=0.1))
+    ranking = StationRanking(stations, k=3, max_per_host=3)
+    assert [station.name for station in ranking.ranked] == ['Pink Floyd Radio', 'Jazz 0', 'Jazz 1']
+
+
+def test_stations_past_the_cap_rank_after_everyone_else():
+    stations = [station("Big %d" % (i,), 'big.example', votes=1000 - i) for i in range(4)]
+    stations += [station("Small %d" % (i,), 'small%d.example' % (i,), votes=10 - i) for i in range(2)]
+    ranking = StationRanking(stations, k=2, max_per_host=2)
+    assert walk_all(ranking) == ['Big 0', 'Big 1', 'Small 0', 'Small 1', 'Big 2', 'Big 3']
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_capped_ranking_keeps_every_station(seed):
+    rng = random.Random(seed)
+    stations = [station("s%d" % (i,), 'host%d' % (rng.randrange(4),), votes=rng.randrange(100))
+                for i in range(rng.randrange(0, 40))]
+    ranking = StationRanking(stations, k=rng.randrange(1, 10), max_per_host=rng.randrange(1, 4))
+    count = len(ranking)
+    assert count == len(stations)
+    assert sorted(walk_all(ranking)) == sorted(station.name for station in stations)
+    assert len(ranking) == count and ranking.remaining() == 0